@@ -1,196 +1,570 @@
+import os
 import re
-from nltk.util import ngrams
+import sys
+import json
+import mmap
+import heapq
+import bisect
+import struct
+import zlib
+import random
+import timeit
+import hashlib
+import multiprocessing
+from array import array
+from collections import OrderedDict
 
-def english_sentences (word_list):
+# only Python 3 has tracemalloc; the benchmark just skips memory peaks without it
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+def array_to_bytes (a):
+    # Python 3 renamed array.tostring/fromstring to tobytes/frombytes
+    if hasattr(a, 'tobytes'):
+        return a.tobytes()
+    return a.tostring()
+
+def array_from_bytes (typecode, data):
+    a = array(typecode)
+    if hasattr(a, 'frombytes'):
+        a.frombytes(data)
+    else:
+        a.fromstring(data)
+    return a
+
+class SymbolTable (object):
+    '''
+    Interns strings (words, stems, ngrams) to small ints, numbered in the order they're first seen, so everything
+    downstream can work on ints and only turn them back into strings for output.
+
+    Example:
+    symbols = SymbolTable()
+    symbols.intern('know')      =>      0
+    symbols.intern('you')       =>      1
+    symbols.intern('know')      =>      0
+    symbols.lookup(1)           =>      'you'
+    '''
+    __slots__ = ('ids', 'strings')
+
+    def __init__ (self):
+        self.ids = {}
+        self.strings = []
+
+    def intern (self, s):
+        i = self.ids.get(s)
+        if i is None:
+            i = len(self.strings)
+            self.ids[s] = i
+            self.strings.append(s)
+        return i
+
+    def get (self, s):
+        # the id of s, or None if it's never been interned
+        return self.ids.get(s)
+
+    def lookup (self, i):
+        return self.strings[i]
+
+    def __len__ (self):
+        return len(self.strings)
+
+
+class OccurrenceIndex (object):
+    '''
+    An inverted index from tokens (words, stems, ngrams) to the sentences they occur in. Built in a single pass over the text:
+    each sentence is numbered by its position as we go, so two identical sentences still get their own indices.
+
+    Example:
+    index = OccurrenceIndex()
+    index.add_sentence (0, ('you', 'know'))
+    index.add_sentence (1, ('i', 'know', 'know'))
+    index.count('know')         =>      3
+    index.locations('know')     =>      [0, 1, 1]
+
+    builds:
+        symbols  <- a SymbolTable giving every token added to the index an int id
+        offsets, ids <- the postings, CSR style: ids holds every token's sentence indices one token after the other (in id
+                    order), and token i's run is ids[offsets[i]:offsets[i + 1]], so its length is the frequency count
+            NOTE that a single index can be listed multiple times, as indices is added whenever a token occurs (even within a single sentence).
+            NOTE that tokens come back out (iteration, examples) in the order they were first added
+        added_tokens, added_sentences <- (token id, sentence index) pairs added since the last read, so building costs
+                    two flat arrays rather than one array object per token
+        overflow <- token id -> array of sentence indices added since the last finalize, for reads in between adds.
+                    A read only sorts the new pairs into overflow; they're folded into offsets and ids once there are more
+                    than a quarter as many as the index already holds, so reading after every add stays linear overall
+    facilitates:
+        sharing one counting engine between english_sentences and puzzle_sentences, and keeping the counts around for reuse
+    '''
+    __slots__ = ('symbols', 'offsets', 'ids', 'added_tokens', 'added_sentences', 'overflow', 'overflow_size')
+
+    def __init__ (self):
+        self.symbols = SymbolTable()
+        self.offsets = array('i', [0])
+        self.ids = array('i')
+        self.added_tokens = array('i')
+        self.added_sentences = array('i')
+        self.overflow = {}
+        self.overflow_size = 0
+
+    def add (self, token, sentence_id):
+        # list the index of the sentence in which the token occurs (a NEW TOKEN just gets the next id)
+        self.added_tokens.append(self.symbols.intern(token))
+        self.added_sentences.append(sentence_id)
+
+    def add_sentence (self, sentence_id, tokens):
+        for token in tokens:
+            self.add (token, sentence_id)
+
+    def add_ids (self, sentence_id, token_ids):
+        # same as add_sentence, for tokens already interned in self.symbols (see iter_ngram_ids)
+        self.added_tokens.extend(token_ids)
+        self.added_sentences.extend(array('i', [sentence_id]) * len(token_ids))
+
+    def extend (self, token, sentence_ids):
+        # add a whole run of occurrences at once, e.g. when merging indexes built over separate chunks of the text
+        self.added_tokens.extend(array('i', [self.symbols.intern(token)]) * len(sentence_ids))
+        self.added_sentences.extend(sentence_ids)
+
+    def flush (self):
+        '''
+        Makes everything added so far readable. Reading from the index calls this for you.
+        '''
+        added = len(self.added_tokens)
+        if not added:
+            return
+        if (self.overflow_size + added) * 4 > len(self.ids):
+            self.finalize()
+            return
+        overflow = self.overflow
+        added_sentences = self.added_sentences
+        for i, token_id in enumerate(self.added_tokens):
+            if token_id not in overflow:
+                overflow[token_id] = array('i')
+            overflow[token_id].append(added_sentences[i])
+        self.overflow_size += added
+        self.added_tokens = array('i')
+        self.added_sentences = array('i')
+
+    def finalize (self):
+        '''
+        Folds everything added since the last call into offsets and ids with a counting sort, keeping each token's
+        sentence indices in the order they were added.
+        '''
+        if not self.added_tokens and not self.overflow:
+            return
+        old_offsets = self.offsets
+        old_ids = self.ids
+        overflow = self.overflow
+        n_old = len(old_offsets) - 1
+        n_tokens = len(self.symbols)
+
+        # count every token's occurrences, old and new, then turn the counts into offsets (counts[i] is token i - 1's)
+        counts = array('i', [0]) * (n_tokens + 1)
+        for token_id in range (0, n_old):
+            counts[token_id + 1] = old_offsets[token_id + 1] - old_offsets[token_id]
+        for token_id, sentence_ids in overflow.items():
+            counts[token_id + 1] += len(sentence_ids)
+        for token_id in self.added_tokens:
+            counts[token_id + 1] += 1
+        total = 0
+        for token_id in range (0, n_tokens + 1):
+            total += counts[token_id]
+            counts[token_id] = total
+        offsets = counts
+
+        # old runs go in first, then the overflow, then the newest occurrences after them
+        ids = array('i', [0]) * offsets[n_tokens]
+        cursor = array('i', offsets)
+        for token_id in range (0, n_old):
+            start, end = old_offsets[token_id], old_offsets[token_id + 1]
+            ids[cursor[token_id]:cursor[token_id] + end - start] = old_ids[start:end]
+            cursor[token_id] += end - start
+        for token_id, sentence_ids in overflow.items():
+            ids[cursor[token_id]:cursor[token_id] + len(sentence_ids)] = sentence_ids
+            cursor[token_id] += len(sentence_ids)
+        added_sentences = self.added_sentences
+        for i, token_id in enumerate(self.added_tokens):
+            position = cursor[token_id]
+            ids[position] = added_sentences[i]
+            cursor[token_id] = position + 1
+
+        self.offsets = offsets
+        self.ids = ids
+        self.added_tokens = array('i')
+        self.added_sentences = array('i')
+        self.overflow = {}
+        self.overflow_size = 0
+
+    def sentence_ids (self, token):
+        # a fresh array of the sentence indices for token, or an empty one
+        self.flush()
+        token_id = self.symbols.get(token)
+        if token_id is None:
+            return array('i')
+        if token_id < len(self.offsets) - 1:
+            sentence_ids = self.ids[self.offsets[token_id]:self.offsets[token_id + 1]]
+        else:
+            sentence_ids = array('i')
+        if token_id in self.overflow:
+            sentence_ids.extend(self.overflow[token_id])
+        return sentence_ids
+
+    def count (self, token):
+        # every occurrence adds one index, so the frequency count is the length of the token's run (and its overflow)
+        self.flush()
+        token_id = self.symbols.get(token)
+        if token_id is None:
+            return 0
+        count = 0
+        if token_id < len(self.offsets) - 1:
+            count = self.offsets[token_id + 1] - self.offsets[token_id]
+        if token_id in self.overflow:
+            count += len(self.overflow[token_id])
+        return count
+
+    def locations (self, token):
+        return list(self.sentence_ids(token))
+
+    def __contains__ (self, token):
+        return self.symbols.get(token) is not None
+
+    def __len__ (self):
+        return len(self.symbols)
+
+    def __iter__ (self):
+        return iter(self.symbols.strings)
+
+    def examples (self, min_count=2, exclude=()):
+        '''
+        Lists every token that occurs at least min_count times, along with where it occurs.
+
+        inputs:
+            min_count   <- the lowest frequency count a token needs to be listed
+            exclude     <- tokens to leave out no matter how often they occur (e.g. common little words)
+        returns:
+            example_map <- a list where each item has the following mapping, in the order the tokens were first added:
+                [ token occuring >= min_count times , [ index_1, index_2 ... index_n ] ]
+        '''
+        self.finalize()
+        # do the filtering on ids, and only look up the strings of the tokens that make it through
+        excluded = set()
+        for token in exclude:
+            token_id = self.symbols.get(token)
+            if token_id is not None:
+                excluded.add(token_id)
+        offsets = self.offsets
+        example_map = []
+        for token_id in range (0, len(offsets) - 1):
+            start, end = offsets[token_id], offsets[token_id + 1]
+            if end - start >= min_count and token_id not in excluded:
+                example_map.append([self.symbols.lookup(token_id), self.ids[start:end].tolist()])
+        return example_map
+
+
+def location_lists (example_map):
+    '''
+    Takes an example map and returns only the numbers in it, unweighted by frequency occurrence.
+
+    Example:
+    location_lists( [['happy', [0, 1]], ['very', [1, 1]], ['sad', [0, 1]]] )   =>     [[0, 1], [1, 1]]
+
+    inputs:
+        example_map <- a list of [ token , [ index_1, index_2 ... index_n ] ] items, as built by OccurrenceIndex.examples
+    returns:
+        return_vals <- every distinct occurrence list, in the order it was first seen
+    '''
+    return_vals = []
+    seen = set()
+    # iterate through results, dig out only occurrence locations, put them in new list with no dups
+    for example in example_map:
+        key = tuple(example[1])
+        if key not in seen:
+            seen.add(key)
+            return_vals.append(example[1])
+    return return_vals
+
+
+# common little words english_sentences leaves out for easier comparison
+STOP_WORDS = frozenset(('the', 'a', 'an', 'if', 'for', 'of', 'to', 'at'))
+
+# suffixes for the fuzzy match in english_sentences. Every group is tried on each word, but inside a group only the first
+# rule that matches applies. Each rule is (suffixes, whether to also cut one letter off a geminate stem)
+SUFFIX_RULES = (
+    ( (('s', 'd'), False), ),
+    ( (('es', 'ed', 'er'), True), (('ing', 'ers', 'est'), True) ),
+)
+
+
+class Stemmer (object):
+    '''
+    Finds the fuzzy-match stems of English words from a table of suffix rules, and remembers the answers for the most
+    recently used words so a word that keeps coming up only gets analysed once.
+
+    Example:
+    Stemmer().stems('masters')      =>      ('master', 'mast')
+    Stemmer().stems('running')      =>      ('run', 'runn')
+
+    inputs:
+        rules       <- suffix rule groups, laid out like SUFFIX_RULES
+        min_length  <- words shorter than this aren't stemmed, to avoid overmatching
+        cache_size  <- how many words to remember; past that, the least recently used word is forgotten
+    facilitates:
+        keeping index_english_sentences' cost tied to the size of the vocabulary rather than the number of words in the text
+    '''
+
+    def __init__ (self, rules=SUFFIX_RULES, min_length=4, cache_size=100000):
+        # precompile each rule to (suffix length, set of suffixes, geminate check) so matching is one slice and one lookup
+        self.rules = []
+        for group in rules:
+            compiled = []
+            for suffixes, geminate in group:
+                for length in sorted(set(len(suffix) for suffix in suffixes)):
+                    compiled.append((length, frozenset(suffix for suffix in suffixes if len(suffix) == length), geminate))
+            self.rules.append(compiled)
+        self.min_length = min_length
+        self.cache_size = cache_size
+        # least recently used first
+        self.cache = OrderedDict()
+
+    def stems (self, word):
+        '''
+        Returns a tuple of the stems to count for word, in the order english_sentences has always added them.
+        '''
+        cache = self.cache
+        found = cache.pop(word, None)
+        if found is None:
+            found = self.analyse(word)
+            if len(cache) >= self.cache_size:
+                cache.popitem(last=False)
+        # (re)inserting puts word at the most recently used end; Python 2's OrderedDict has no move_to_end
+        cache[word] = found
+        return found
+
+    def analyse (self, word):
+        stems = []
+        if len(word) < self.min_length:
+            return tuple(stems)
+        for group in self.rules:
+            for length, suffixes, geminate in group:
+                if word[len(word)-length:] in suffixes:
+                    stem = word[:len(word)-length]
+                    # check to see if last 2 chars of stem are geminate; if so, count the shorter stem too
+                    if geminate and stem[len(stem)-2] == stem[len(stem)-1]:
+                        stems.append(stem[:len(stem)-1])
+                    stems.append(stem)
+                    # only the first matching rule in a group counts
+                    break
+        return tuple(stems)
+
+
+# shared by every english_sentences call, so the memo carries over between corpora
+ENGLISH_STEMMER = Stemmer()
+
+
+def index_english_sentences (word_list, stemmer=None):
+    '''
+    Builds the OccurrenceIndex behind english_sentences: every word, plus the fuzzy-matched stems of longer words.
+
+    inputs:
+        word_list <- a list (or any iterable, e.g. iter_words) of sublists. Each sublist should be a full English phrase or sentence broken into words.
+        stemmer   <- the Stemmer used for the fuzzy match (defaults to ENGLISH_STEMMER)
+    returns:
+        index <- an OccurrenceIndex of every lexical item found in the text
+    '''
+    if stemmer is None:
+        stemmer = ENGLISH_STEMMER
+    index = OccurrenceIndex()
+
+    # use the word list to go thru the example sentences, look for occurrences & put those occurrences in the index
+    for sentence_id, sentence in enumerate(word_list):
+        for word in sentence:
+            index.add (word, sentence_id)
+            # FUZZY MATCH TEST: add the stem of words that contain common suffixes
+            for stem in stemmer.stems(word):
+                index.add (stem, sentence_id)
+
+    return index
+
+
+def english_sentences (word_list, stop_words=STOP_WORDS):
     '''
     Takes a list of English sentences broken into words, then determines the frequency count and location of each word within the list.
     Uses a fuzzy definition of word closer to "lexical item".
 
     Example:
-    english_sentences( (('I', 'am', 'not', 'happy') , ('You', 'are', 'very', 'very', 'happy')) )   =>     [['happy', [0, 1]], ['very', [1, 1]]]
-        
+    english_sentences( (('I', 'am', 'not', 'happy') , ('You', 'are', 'very', 'very', 'happy')) )   =>     [[0, 1], [1, 1]]
+
     inputs:
-        word_list <- a list of sublists. Each sublist should be a full English phrase or sentence broken into words.
+        word_list  <- a list of sublists. Each sublist should be a full English phrase or sentence broken into words.
+        stop_words <- common little words to leave out of the results (defaults to STOP_WORDS)
     builds:
-        word_dict <- a dictionary with:
+        index <- an OccurrenceIndex (see index_english_sentences) with:
             KEYS <- every lexical item that occurs in the English text
-            VALUES <- (num_occurrences , (index_1, index_2 ... index_n) ) where index_n is the sentence number location of each occurrence
-            NOTE that a single index can be listed multiple times, as indices is added whenever a word occurs (even within a single sentence).
-    returns:
-        example_map <- a list out of word_dict where each item that occurs more than once has the following mapping:
+            VALUES <- (index_1, index_2 ... index_n) where index_n is the sentence number location of each occurrence
+        example_map <- index.examples(), where each item that occurs more than once has the following mapping:
             [ key occuring > 1 times , [ index_1, index_2 ... index_n ]
             NOTE that a single index can be listed multiple times, as indices is added whenever a word occurs (even within a single sentence).
-            NOTE that the bottom branch currently gets rid of common little words like determiners
+            NOTE that common little words like determiners (stop_words) are left out
+    returns:
+        return_vals <- only the distinct location lists in example_map, unweighted by frequency occurrence
     facilitates:
         comparing word_dict to a similar dictionary in a candidate language for coherence patterns among the index numbers to guess at translations
     '''
-    
-    word_dict = {}      # will be used to associate occurrences of words with when and where they occur in text
+    index = index_english_sentences(word_list)
+    # get rid of common little words for easier comparison
+    example_map = index.examples(exclude=stop_words)
+    return location_lists(example_map)
+
 
-    # use the word list to go thru the example sentences, look for occurrences & put those occurrences in word_dict
-    # grab each word from our list
-    for sentence in word_list:
+def index_puzzle_sentences (word_list, first_sentence=0):
+    '''
+    Builds the OccurrenceIndex behind puzzle_sentences: every ngram of every word, tagged with its sentence number.
+
+    inputs:
+        word_list       <- a list (or any iterable, e.g. iter_ngrams) of sublists and subsublists. Each sublist should be a full phrase or sentence broken into words, while each subsublist is ngrams of those words.
+        first_sentence  <- the sentence number of the first sentence in word_list (for indexing part of a bigger text)
+    returns:
+        index <- an OccurrenceIndex of every ngram found in the text
+    '''
+    index = OccurrenceIndex()
+    for sentence_id, sentence in enumerate(word_list, first_sentence):
         for word in sentence:
-            # NEW WORD FOUND: add dict entry for this frequency and index
-            if word not in word_dict:
-                word_dict[word] = [1, [word_list.index(sentence)] ]
-            # ANOTHER INSTANCE FOUND: augment dict entry for this frequency and index
-            elif word in word_dict:
-                # increase the frequency count by 1
-                word_dict[word][0] += 1
-                # list the index of the sentence in which the word occurs
-                word_dict[word][1].append(word_list.index(sentence))
+            index.add_sentence (sentence_id, word)
+    return index
 
-            # FUZZY MATCH TEST: add the stem of words that contain common suffixes
-            # 
-            if len(word) > 3:
-            # filter for longer words to avoid overmatching
-                # check if the last letter is a suffix
-                if word[len(word)-1:len(word)] in ('s', 'd'):
-                    stem = word[:len(word)-1]
-                    # increase count and index if it's already in the dict
-                    if stem in word_dict:
-                        word_dict[stem][0] += 1
-                        word_dict[stem][1].append (word_list.index(sentence))
-                    # add stem if it's not in dict
-                    else:
-                        word_dict[stem] = [1 , [word_list.index(sentence)] ]
-                # check if the last two letters are a suffix
-                if word[len(word)-2:len(word)] in ('es', 'ed', 'er'):
-                    stem = word[:len(word)-2]
-                    # check to see if last 2 chars of stem are geminate; if so, cut the stem shorter 
-                    if stem[len(stem)-2] == stem[len(stem)-1]:
-                        stem_short = stem[:len(stem)-1]
-                        if stem_short in word_dict:
-                            word_dict[stem_short][0] += 1
-                            word_dict[stem_short][1].append (word_list.index(sentence))
-                        # add stem if it's not in dict
-                        else:
-                            word_dict[stem_short] = [1 , [word_list.index(sentence)] ]
-                    # increase count and index of the stem if it's already in the dict
-                    if stem in word_dict:
-                        word_dict[stem][0] += 1
-                        word_dict[stem][1].append (word_list.index(sentence))
-                    # add stem if it's not in dict
-                    else:
-                        word_dict[stem] = [1 , [word_list.index(sentence)] ]
-                # check if the last three letters are a suffix
-                elif word[len(word)-3:len(word)] in ('ing', 'ers', 'est'):
-                    stem = word[:len(word)-3]
-                    # check to see if last 2 chars of stem are geminate; if so, cut the stem shorter 
-                    if stem[len(stem)-2] == stem[len(stem)-1]:
-                        stem_short = stem[:len(stem)-1]
-                        if stem_short in word_dict:
-                            word_dict[stem_short][0] += 1
-                            word_dict[stem_short][1].append (word_list.index(sentence))
-                        # add stem if it's not in dict
-                        else:
-                            word_dict[stem_short] = [1 , [word_list.index(sentence)] ]
-                    # increase count and index of the stem if it's already in the dict
-                    if stem in word_dict:
-                        word_dict[stem][0] += 1
-                        word_dict[stem][1].append (word_list.index(sentence))
-                    # add stem if it's not in dict
-                    else:
-                        word_dict[stem] = [1 , [word_list.index(sentence)] ]
-                else:
-                    pass
-            
-    # create a list in which all found words and locations will be stored
-    example_map = []
-    # add to list only words that occur more than once, along with their locations
-    for k in word_dict:
-        # get rid of common little words for easier comparison
-        if k not in ('the', 'a', 'an', 'if', 'for', 'of', 'to', 'at'):
-            if word_dict[k][0] > 1:
-                example = [k , word_dict[k][1] ]
-                example_map.append(example)
-
-    # return only the numbers in the example map, unweighted by frequency occurrence
-    return_vals = []
-    for i in range (0, len(example_map) ):
-    # iterate through results, dig out only occurrence locations, put them in new list with no dups
-        if example_map[i][1] not in return_vals:
-            return_vals.append(example_map[i][1])
-            
-    return return_vals
 
+def index_puzzle_words (word_list, gram_length=3, max_length=None, first_sentence=0):
+    '''
+    Builds the same OccurrenceIndex as index_puzzle_sentences(parse_ngrams(word_list, gram_length, max_length)), but
+    straight from the words: ngrams are interned as they're made (see iter_ngram_ids), so no ngram strings are kept
+    around past their first occurrence and the list-of-lists-of-lists is never built.
+
+    inputs:
+        word_list       <- a list (or any iterable, e.g. iter_words) of sublists, where each sublist contains all of the words in a sentence
+        gram_length     <- the MIN length of ngrams (see parse_ngrams)
+        max_length      <- the MAX length of ngrams (see parse_ngrams)
+        first_sentence  <- the sentence number of the first sentence in word_list (for indexing part of a bigger text)
+    '''
+    index = OccurrenceIndex()
+    for sentence_id, gram_ids in enumerate(iter_ngram_ids(word_list, index.symbols, gram_length, max_length), first_sentence):
+        index.add_ids (sentence_id, gram_ids)
+    return index
+
+
+def prune_examples (example_map):
+    '''
+    Cleans up an example map by removing ngrams that are substrings of a longer ngram with the same list of sentence occurrences.
+
+    Example:
+    prune_examples( [['yyy', [0, 1]], ['yyyy', [0, 1]], ['xyg', [1, 1]], ['yyx', [0, 1]]] )   =>   [['yyyy', [0, 1]], ['xyg', [1, 1]], ['yyx', [0, 1]]]
+
+    inputs:
+        example_map <- a list of [ ngram , [ index_1, index_2 ... index_n ] ] items, as built by OccurrenceIndex.examples
+    returns:
+        new_example_map <- the same items minus the redundant shorter ngrams, still in their original order
+
+    Ngrams are grouped by their occurrence list first, so containment only ever gets checked inside a group. Within a group
+    the longest ngrams go first, and every substring of each one we keep is remembered; anything shorter that turns up in
+    there is covered by a longer ngram already kept (directly or through one we dropped), so it goes.
+    '''
+    # group the ngrams by their occurrence lists
+    groups = {}
+    for entry in example_map:
+        groups.setdefault(tuple(entry[1]), []).append(entry[0])
+
+    dropped = set()
+    for grams in groups.values():
+        if len(grams) < 2:
+            continue
+        covered = set()
+        for gram in sorted(grams, key=len, reverse=True):
+            if gram in covered:
+                dropped.add(gram)
+                continue
+            # remember every shorter substring of the ngram we're keeping
+            for i in range (1, len(gram)):
+                for start in range (0, len(gram) - i + 1):
+                    covered.add(gram[start:start + i])
 
-def puzzle_sentences (word_list):
+    new_example_map = []
+    for entry in example_map:
+        if entry[0] not in dropped:
+            new_example_map.append(entry)
+    return new_example_map
+
+
+def puzzle_sentences (word_list, prune=False):
     '''
     Takes a list of unknown sentences. Determines if any of their grams show up anywhere else in the sentences. Returns a list
     of all the examples of multiple matches, including which sentences they occur in.
 
     Example:
-    puzzle_sentences( (('zzxzzz gyyyggr') , ('zzz yyyyxyg')) )   =>     [['zzz', [0, 1]], ['yyyy', [0, 1]]]
-        
+    puzzle_sentences( (('zzxzzz gyyyggr') , ('zzz yyyyxyg')) )   =>     [[0, 1]]
+
     inputs:
         word_list <- a list of sublists and subsublists. Each sublist should be a full phrase or sentence broken into words, while each subsublist is ngrams of those words.
+        prune     <- if True, drop every ngram that only ever shows up inside a longer ngram with the same occurrences (see prune_examples)
     builds:
-        word_dict <- a dictionary with:
+        index <- an OccurrenceIndex (see index_puzzle_sentences) with:
             KEYS <- every ngram that occurs in the text
-            VALUES <- (num_occurrences , (index_1, index_2 ... index_n) ) where index_n is the sentence number location of each occurrence
-    returns:
-        example_map <- a list out of word_dict where each item that occurs more than once has the following mapping:
+            VALUES <- (index_1, index_2 ... index_n) where index_n is the sentence number location of each occurrence
+        example_map <- index.examples(), where each item that occurs more than once has the following mapping:
             [ key occuring > 1 times , [ index_1, index_2 ... index_n ]
             NOTE that a single index can be listed multiple times, as indices is added whenever a word occurs (even within a single sentence).
+    returns:
+        return_vals <- only the distinct location lists in example_map, unweighted by frequency occurrence
     facilitates:
         comparing word_dict to a similar dictionary in a candidate language for coherence patterns among the index numbers to guess at translations
     '''
-    
-    word_dict = {}      # will be used to associate occurrences of words with when and where they occur in text
-
-    # use the word list to go thru the example sentences, look for occurrences & put those occurrences in word_dict
-    # grab each word from our list
-    for sentence in word_list:
-        for word in sentence:
-            for gram in word:
-            
-                # NEW MATCH FOUND: add dict entry for this frequency and index
-                if gram not in word_dict:
-                    word_dict[gram] = [1, [word_list.index(sentence)] ]
-            
-                # ANOTHER INSTANCE FOUND: augment dict entry for this frequency and index
-                elif gram in word_dict:
-                    # increase the frequency count by 1
-                    word_dict[gram][0] += 1
-                    # list the index of the sentence in which the word occurs
-                    word_dict[gram][1].append(word_list.index(sentence))
-
-    # create a list in which all matched ngrams will be stored
-    example_map = []
-    # add to list only ngrams that occur more than once, along with locations
-    for k in word_dict:
-        if word_dict[k][0] > 1:
-            example = [k , word_dict[k][1] ]
-            example_map.append(example)
+    index = index_puzzle_sentences(word_list)
+    example_map = index.examples()
 
     # clean up examples by removing substrings with the same list of sentence occurrences
-    # create a list for all the words
-##    temp_list = []
-##    # create a list that we can change while iterating thru example_map
-##    new_example_map = []
-##    # populate our two lists from example_map
-##    for entry in example_map:
-##        temp_list.append(entry[0])
-##        new_example_map.append(entry)
-##    # check all examples against each other
-##    for i in temp_list:
-##        for j in example_map:
-##            # remove submatching ngrams if one is a substring of the other and they both occur in the same sentences
-##            if j[0] in i and len(j[0]) < len(i) and j[1] == example_map[temp_list.index(i)][1]:
-##                if [j[0],j[1]] in new_example_map:
-##                # take it from the new list (so you don't mess up the loop) but only try if it's in the new list (otherwise error)
-##                    new_example_map.remove([j[0],j[1]])
-
-    # return only the numbers in the example map, unweighted by frequency occurrence
-    return_vals = []
-    for i in range (0, len(example_map) ):
-    # iterate through results, dig out only occurrence locations, put them in new list with no dups
-        if example_map[i][1] not in return_vals:
-            return_vals.append(example_map[i][1])
+    if prune:
+        example_map = prune_examples(example_map)
 
-    return return_vals
+    return location_lists(example_map)
+
+
+def read_sentences (path):
+    '''
+    Reads a text file one line at a time, yielding each line as a sentence. Nothing past the current line is held in memory.
+
+    inputs:
+        path    <- a text file with one sentence per line
+    yields:
+        each line with its line ending stripped; blank lines are yielded too, so sentence numbers stay equal to line numbers
+
+    facilitates:
+        feeding corpora too big for a list into iter_words / iter_ngrams / the occurrence indexes
+    '''
+    with open(path) as f:
+        for line in f:
+            yield line.rstrip('\r\n')
+
+
+def iter_words (sentences):
+    '''
+    Streaming version of parse_words: takes any iterable of sentences (a list, a file, read_sentences) and yields one
+    wordlist per sentence as it goes.
+
+    Example:
+    list(iter_words( ('I am happy.' , 'You are happy!') ))   =>      [['i', 'am', 'happy'] , ['you', 'are', 'happy']]
+    '''
+    # chop up each sentence into a list of words using regex
+    for s in sentences:
+        # create a temporary tuple of words and a permanent list where filtered words will be stored
+        temp_words = re.split (r'\W+', s)
+        words_in_s = []
+        # take the temporary list of words and add each, uncapsed, to the permanent list
+        for w in temp_words:
+            # only add the word to the new permanent list if it's not empty ''
+            if w != '':
+                words_in_s.append(w.lower())
+        # hand back this sentence's words before reading the next one
+        yield words_in_s
 
 
 def parse_words (sentence_list):
@@ -208,36 +582,83 @@ def parse_words (sentence_list):
     facilitates:
         counting the occurrence location and frequency of words within each sentence
     '''
-    # create a new list to store lists of sentences, broken into words
-    word_list = []
+    return list(iter_words(sentence_list))
 
-    # chop up each sentence into a list of words using regex
-    for s in sentence_list:
-        # create a temporary tuple of words and a permanent list where filtered words will be stored
-        temp_words = re.split ('\W+', s)
-        words_in_s = []
-        # determine and store the sentence's punctuation mark
-        #if '.' in s:
-        #    punct = '.'
-        #elif '!' in s:
-        #    punct = '!'            
-        #elif '?' in s:
-        #    punct = '?'
-        #else:
-        #    pass
-        # take the temporary list of words and add each, uncapsed, to the permanent list
-        for w in temp_words:
-            # only add the word to the new permanent list if it's not empty ''
-            if w != '':
-                words_in_s.append(w.lower())
-        ## add the sentence's punctuation mark to the list
-        #words_in_s.append(punct)
-        # add the permanent list to the total word_list (the list of all sentences, broken into words)
-        word_list.append(words_in_s)
-        
-    return word_list
 
-def parse_ngrams (word_list, gram_length=3):
+def word_grams (w, gram_length=3, max_length=None):
+    '''
+    Takes a single word and lists every ngram in it, shortest first, as plain string slices.
+
+    Example:
+    word_grams('know', 3)       =>      ['kno', 'now']
+    word_grams('donkey', 3, 4)  =>      ['don', 'onk', 'nke', 'key', 'donk', 'onke', 'nkey']
+
+    inputs:
+        w           <- the word to break down
+        gram_length <- the MIN length of ngrams
+        max_length  <- the MAX length of ngrams (None means no cap)
+        NOTE the word itself is never one of its own ngrams, same as before
+    outputs:
+        grams       <- a list of ngram strings, grouped by length and in order of where they start within each length
+    '''
+    # the longest ngram is one char short of the whole word
+    longest = len(w) - 1
+    if max_length is not None and max_length < longest:
+        longest = max_length
+    grams = []
+    for i in range (gram_length, longest + 1):
+        for start in range (0, len(w) - i + 1):
+            grams.append(w[start:start + i])
+    return grams
+
+
+def iter_ngrams (word_lists, gram_length=3, max_length=None):
+    '''
+    Streaming version of parse_ngrams: takes any iterable of wordlists (a list, iter_words) and yields one sentence's
+    words broken into ngrams at a time.
+
+    Example:
+    list(iter_ngrams( (('i', 'know') , ('you', 'know')) , 3))   =>   [ [['kno', 'now']] , [['kno', 'now']] ]
+    '''
+    # chop up each sentence into a list of ngrams of all reasonable lengths using word_grams
+    for s in word_lists:
+    # drill down into the sentences
+        this_sentence = []
+        for w in s:
+        # drill down to the words in the sentence, and break each one down into all ngrams between user's gram_length and the word's length
+            this_word = word_grams(w, gram_length, max_length)
+            # if the word's not empty, add this word into a list for each sentence
+            if this_word != []:
+                this_sentence.append(this_word)
+        # hand back this sentence's ngrams before reading the next one
+        yield this_sentence
+
+
+def iter_ngram_ids (word_lists, symbols, gram_length=3, max_length=None):
+    '''
+    Interned version of iter_ngrams: yields one flat array of ngram ids per sentence, every word's ngrams one after the
+    other, interning the ngrams in symbols as it goes. Each distinct word is only broken into ngrams once.
+
+    Example:
+    symbols = SymbolTable()
+    list(iter_ngram_ids( (('i', 'know') , ('you', 'know')) , symbols, 3))   =>   [ array('i', [0, 1]) , array('i', [0, 1]) ]
+    symbols.strings     =>      ['kno', 'now']
+
+    NOTE ngrams get their ids in the same order index_puzzle_sentences would have added them
+    '''
+    word_ids = {}
+    for s in word_lists:
+        this_sentence = array('i')
+        for w in s:
+            ids = word_ids.get(w)
+            if ids is None:
+                ids = array('i', [symbols.intern(gram) for gram in word_grams(w, gram_length, max_length)])
+                word_ids[w] = ids
+            this_sentence.extend(ids)
+        yield this_sentence
+
+
+def parse_ngrams (word_list, gram_length=3, max_length=None):
     '''
     Takes a list of sentences broken into words and turns it into a list of sentences broken into words broken into ngrams.
 
@@ -247,6 +668,7 @@ def parse_ngrams (word_list, gram_length=3):
     inputs:
         word_list   <- a list of lists, where each sublist contains all of the words in a sentence
         gram_length <- the MIN length of ngrams to search for within each word
+        max_length  <- the MAX length of ngrams to search for within each word (None means up to one char short of the word)
         NOTE output will not include anything shorter than the user declared ngram length!
         
     outputs:
@@ -258,136 +680,1608 @@ def parse_ngrams (word_list, gram_length=3):
     facilitates:
         counting the occurrence location and frequency of ngrams within each sentence
     '''
-    # create a new list to store lists of sentences, broken into ngrams
-    ngram_list = []
+    return list(iter_ngrams(word_list, gram_length, max_length))
 
-    # chop up each sentence into a list of ngrams of all reasonable lengths using NLTK.util ngrams (imported at top of this py)
-    for s in word_list:
-    # drill down into the sentences
-        this_sentence = []
-        for w in s:
-        # drill down to the words in the sentence
-            this_word = []
-            for i in range (gram_length, len(w)):
-            # break the word down into all ngrams between user's gram_length and the word's length                
-                for j in ngrams(w,i):
-                    # ngrams returns a tuple; make entries into strings
-                    this_gram = ''
-                    for char in j:
-                        this_gram += char
-                    # add each string into a list for each word
-                    this_word.append(this_gram)
-            # if the word's not empty, add this word into a list for each sentence
-            if this_word != []:
-                this_sentence.append(this_word)
-        # add each sentence back into the total list
-        ngram_list.append(this_sentence)
 
-    return ngram_list
+def index_english_file (path):
+    '''
+    Streams an English text file (one sentence per line) straight into index_english_sentences, one sentence at a time.
+    Memory use is bounded by the index itself, not by the size of the file.
+    '''
+    return index_english_sentences(iter_words(read_sentences(path)))
+
 
-def deg_separ_matcher (loc_list):
+def index_puzzle_file (path, gram_length=3, max_length=None):
     '''
-    Takes a list of lists of occurrence locations searches it for degree-of-separation patterns (do numbers that occur with numbers that occur with me also occur with me?).
-        
+    Streams an unknown-script text file (one sentence per line) through iter_words straight into index_puzzle_words,
+    so only one sentence's ngram ids exist at a time instead of the whole list-of-lists-of-lists.
+    '''
+    return index_puzzle_words(iter_words(read_sentences(path)), gram_length, max_length)
+
+
+def gram_shard (gram, shards):
+    # which shard a gram's postings are merged in; crc32 is the same in every process, unlike hash() on Python 3
+    data = gram if isinstance(gram, bytes) else gram.encode('utf-8')
+    return (zlib.crc32(data) & 0xffffffff) % shards
+
+
+def index_puzzle_chunk (chunk):
+    '''
+    First worker for index_puzzle_parallel: runs parse_words -> parse_ngrams -> counting over one chunk of sentences, and
+    splits the result up by shard (see gram_shard).
+
     inputs:
-        loc_list    <-  a list of sublists, where each sublist is a collection of locations where a word/ngram match was found
-    outputs:
-        decision    <-  a dictionary mapping to a decision tree, where each
-                        KEY     is the number under consideration in a location list, and
-                        VALUE   is a list of n-branch depth searches for numbers that occur in any list with the previous branching number, along with Y or N for whether that number also occurs in any list with the original KEY number
+        chunk       <- (offset, sentences, gram_length, max_length, shards), where offset is the sentence number of the chunk's first sentence
+    returns:
+        n_grams     <- how many different ngrams the chunk has
+        parts       <- one (grams, local_ids, counts, ids) per shard, where
+                       grams        <- the shard's ngrams, in the order they first show up in the chunk
+                       local_ids    <- the raw bytes of an array of where each of those ngrams comes in that order over the whole chunk
+                       counts       <- the raw bytes of an array holding how many times each of those ngrams occurs
+                       ids          <- the raw bytes of one array holding every ngram's sentence numbers, one ngram after the other
+                       NOTE sentence numbers are counted from the start of the whole text, not the chunk
+        (flat arrays as bytes cost far less to send between processes than one small array per ngram)
+    '''
+    offset, sentences, gram_length, max_length, shards = chunk
+    index = index_puzzle_words(iter_words(sentences), gram_length, max_length, offset)
+    index.finalize()
 
-            e.g. traversing [[0,1,3],[0,2,4]], looking at the key 1:
+    # the index already numbers its ngrams in the order they first show up, and keeps their runs in that order
+    offsets = index.offsets
+    parts = [([], array('i'), array('i'), array('i')) for shard in range (0, shards)]
+    for local_id, gram in enumerate(index.symbols.strings):
+        grams, local_ids, counts, ids = parts[gram_shard(gram, shards)]
+        grams.append(gram)
+        local_ids.append(local_id)
+        counts.append(offsets[local_id + 1] - offsets[local_id])
+        ids.extend(index.ids[offsets[local_id]:offsets[local_id + 1]])
+    return len(index.symbols), [(grams, array_to_bytes(local_ids), array_to_bytes(counts), array_to_bytes(ids))
+                                for grams, local_ids, counts, ids in parts]
 
-                          1            1
-                         / \          / \
-                        0   3        Y   Y
-                       / \          / \
-                      2   4        N  N
 
-                    yields the entry    1: [[Y,Y],[N,N]]
+def merge_puzzle_shard (shard):
+    '''
+    Second worker for index_puzzle_parallel: merges one shard's parts from every chunk, first chunk first.
 
-    facilitates:
-        matching patterns between distinct sets of numbers, where the pattern of cooccurrences has strict logical coherence, but the mapping between numbers is unknown
+    inputs:
+        shard       <- (stride, parts), where parts is a list of (chunk number, grams, local_ids, counts, ids), as from index_puzzle_chunk,
+                       and stride is more than the number of ngrams in any chunk
+    returns:
+        grams       <- the shard's ngrams, in the order they first show up in the whole text
+        keys        <- for each of those, chunk number * stride + its local id in the first chunk it shows up in, so
+                       sorting every shard's ngrams by key puts them in the order the serial pass would have found them
+        counts, ids <- the raw bytes of the ngrams' counts and sentence numbers, as in index_puzzle_chunk
     '''
+    stride, parts = shard
+    grams = []
+    keys = []
+    runs = {}
+    for chunk_number, chunk_grams, local_ids, counts, ids in parts:
+        local_ids = array_from_bytes('i', local_ids)
+        counts = array_from_bytes('i', counts)
+        ids = array_from_bytes('i', ids)
+        start = 0
+        for i, gram in enumerate(chunk_grams):
+            run = ids[start:start + counts[i]]
+            start += counts[i]
+            if gram in runs:
+                runs[gram].append(run)
+            else:
+                runs[gram] = [run]
+                grams.append(gram)
+                keys.append(chunk_number * stride + local_ids[i])
 
-    pattern_dict = {}
+    counts = array('i')
+    ids = array('i')
+    for gram in grams:
+        before = len(ids)
+        for run in runs[gram]:
+            ids.extend(run)
+        counts.append(len(ids) - before)
+    return grams, keys, array_to_bytes(counts), array_to_bytes(ids)
 
-    # create a basic dictionary associating each num with other nums that occur in same list at any point
-    for locations in loc_list:
-    # drill into list of nums
-        for loc in locations:
-        # drill down to nums themselves
-            # create a list of locations that cooccur with loc
-            if loc not in pattern_dict:
-            # new dictionary entry if num isn't already a key
-                pattern_dict[loc] = []
-            for loc2 in locations:
-            # add nums that aren't already in that value and that aren't identical to the key (keys always occur with themselves in a list!)
-                if loc2 != loc and loc2 not in pattern_dict[loc]:
-                    pattern_dict[loc].append (loc2)
 
-    # take pattern dictionary above and branch patterns based on degree of separation of cooccurrences
-    solutions_dict = {}
-    for loc in pattern_dict:
-        lvl_1 = []
-        lvl_2 = []
-        lvl_3 = []
-        # dig into the first branch. All these cooccur with loc, so pass Y for each
-        for coloc in pattern_dict[loc]:
-            lvl_1.append('Y')
-            lvl_1.append(coloc)
-            #dig into the 2nd branch. Check if the number in question occurs within the coloc's list
-            for sub_coloc in pattern_dict[coloc]:
-                # is the original num in the list of nums that occur (sub_colocs) with the nums that occur (colocs) with the original num?
-                if loc in pattern_dict[sub_coloc] and sub_coloc not in lvl_1:
-                    lvl_2.append('Y')
-                    lvl_2.append(sub_coloc)
-                elif loc not in pattern_dict[sub_coloc] and sub_coloc not in lvl_1:
-                    lvl_2.append('N')
-                    lvl_2.append(sub_coloc)
-                else:
-                    pass
-                #dig into the 3rd branch. Check if the number in question occurs within the sub_coloc's list
-                for sub_sub_coloc in pattern_dict[sub_coloc]:
-                # is the original num in the list of nums that occur (sub_sub_colocs) with the numbs that cooccur (sub_colocs) with the nums that cooccur (colocs) with the original num?                    
-                    if loc in pattern_dict[sub_sub_coloc] and sub_sub_coloc not in lvl_2:
-                        lvl_3.append('Y')
-                    elif loc not in pattern_dict[sub_sub_coloc] and sub_sub_coloc not in lvl_2:
-                        lvl_3.append('N')
-                    else:
-                        pass
-        # add loc's first list to total list
-        total = [lvl_1, lvl_2, lvl_3]
-        solutions_dict[loc] = total
-        
-    return solutions_dict
+def index_puzzle_parallel (sentence_list, gram_length=3, max_length=None, processes=None, chunk_size=None):
+    '''
+    Builds the same OccurrenceIndex as index_puzzle_words(parse_words(sentence_list), gram_length, max_length), but
+    splits the work over a pool of worker processes.
+
+    inputs:
+        sentence_list   <- a list of unknown sentences
+        gram_length     <- the MIN length of ngrams (see parse_ngrams)
+        max_length      <- the MAX length of ngrams (see parse_ngrams)
+        processes       <- how many worker processes to run (defaults to one per CPU; 1 just runs index_puzzle_words)
+        chunk_size      <- how many sentences go to a worker at a time (defaults to one chunk per process, since every
+                           chunk repeats the merge work for the ngrams it shares with the others)
+    returns:
+        index           <- an OccurrenceIndex of every ngram found in the text
+
+    Two rounds of workers do all the per-occurrence work: the first indexes chunks of sentences and splits each chunk's
+    ngrams into shards by gram_shard, the second merges each shard across the chunks (see merge_puzzle_shard). This
+    process then only puts the shards' ngrams in first-seen order and copies one run per ngram into the index, so its
+    share of the work goes with the number of different ngrams, not with the size of the text.
+    The result is identical to the serial one.
+    '''
+    sentences = list(sentence_list)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if chunk_size is None:
+        chunk_size = max(1, -(-len(sentences) // processes))
+    if processes == 1 or len(sentences) <= chunk_size:
+        return index_puzzle_words(iter_words(sentences), gram_length, max_length)
+
+    shards = processes
+    chunks = []
+    for offset in range (0, len(sentences), chunk_size):
+        chunks.append((offset, sentences[offset:offset + chunk_size], gram_length, max_length, shards))
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        partials = pool.map(index_puzzle_chunk, chunks)
+        stride = max([n_grams for n_grams, parts in partials]) + 1
+        work = []
+        for shard in range (0, shards):
+            work.append((stride, [(chunk_number,) + parts[shard] for chunk_number, (n_grams, parts) in enumerate(partials)]))
+        del partials
+        merged = pool.map(merge_puzzle_shard, work)
+        del work
+    finally:
+        pool.close()
+        pool.join()
+
+    # line every shard's ngrams up in one list, then sort them into first-seen order by their keys
+    grams = []
+    keys = []
+    counts = array('i')
+    ids = array('i')
+    for shard_grams, shard_keys, shard_counts, shard_ids in merged:
+        grams.extend(shard_grams)
+        keys.extend(shard_keys)
+        counts.extend(array_from_bytes('i', shard_counts))
+        ids.extend(array_from_bytes('i', shard_ids))
+    del merged
+    starts = array('i', [0]) * len(counts)
+    total = 0
+    for i in range (0, len(counts)):
+        starts[i] = total
+        total += counts[i]
+
+    index = OccurrenceIndex()
+    offsets = array('i', [0]) * (len(grams) + 1)
+    index_ids = array('i')
+    for token_id, i in enumerate(sorted(range (0, len(keys)), key=keys.__getitem__)):
+        index.symbols.intern(grams[i])
+        index_ids.extend(ids[starts[i]:starts[i] + counts[i]])
+        offsets[token_id + 1] = len(index_ids)
+    index.offsets = offsets
+    index.ids = index_ids
+    return index
+
+
+def puzzle_sentences_parallel (sentence_list, gram_length=3, prune=False, processes=None, max_length=None):
+    '''
+    Parallel version of puzzle_sentences(parse_ngrams(parse_words(sentence_list), gram_length, max_length), prune), built with
+    index_puzzle_parallel. Takes the raw sentences rather than their ngrams, since the workers do the parsing.
+    '''
+    example_map = index_puzzle_parallel(sentence_list, gram_length, max_length, processes=processes).examples()
+    if prune:
+        example_map = prune_examples(example_map)
+    return location_lists(example_map)
+
+def pack_nested (nested, depth):
+    '''
+    Flattens a list of lists (of lists ...) of strings into flat arrays, CSR style, so it can be written out in one go.
+
+    Example:
+    pack_nested( [['ho', 'ton'], ['ton']] , 2)   =>   ( ['ho', 'ton'] , [array('i', [0, 2, 3])] , array('i', [0, 1, 1]) )
+
+    inputs:
+        nested  <- e.g. the output of parse_words (depth 2) or parse_ngrams (depth 3)
+        depth   <- how many levels of lists there are, counting the strings
+    outputs:
+        strings <- every distinct string, in the order first seen
+        levels  <- one array of offsets per level of lists, outermost first; item j of a level runs from offsets[j] to
+                   offsets[j+1] in the next level down (the innermost level points into ids)
+        ids     <- every string, as its position in strings
+    '''
+    strings = []
+    string_ids = {}
+    levels = [array('i', [0]) for level in range (0, depth - 1)]
+    ids = array('i')
+
+    def walk (items, level):
+        for item in items:
+            if level == depth - 1:
+                if item not in string_ids:
+                    string_ids[item] = len(strings)
+                    strings.append(item)
+                ids.append(string_ids[item])
+            else:
+                walk (item, level + 1)
+                # close off this item where the level below it has got to
+                if level == depth - 2:
+                    levels[level].append(len(ids))
+                else:
+                    levels[level].append(len(levels[level + 1]) - 1)
+
+    walk (nested, 0)
+    return strings, levels, ids
+
+
+def unpack_nested (strings, levels, ids):
+    '''
+    Rebuilds the nested lists that pack_nested flattened.
+    '''
+    def build (level, start, end):
+        if level == len(levels):
+            return [strings[i] for i in ids[start:end]]
+        offsets = levels[level]
+        return [build(level + 1, offsets[j], offsets[j + 1]) for j in range (start, end)]
+    return build(0, 0, len(levels[0]) - 1)
+
+
+# every cache file starts with this, then the length of a JSON header, the header, and the data
+CACHE_MAGIC = b'IOLC1\n'
+# goes into every cache key; bump it whenever the way keys or entries are made changes, so old entries are never read back
+CACHE_KEY_VERSION = b'ioling-cache-key/2'
+
+
+def write_packed (path, arrays, strings):
+    '''
+    Writes named int arrays and string lists to a single binary file that PackedFile can memory-map.
+
+    inputs:
+        path    <- where to write
+        arrays  <- a dictionary of name -> array('i')
+        strings <- a dictionary of name -> list of strings (none of which may contain a newline)
+    layout:
+        CACHE_MAGIC, a 4-byte little-endian header length, a JSON header mapping each section's name to its
+        [byte offset, length], then the sections themselves: arrays as raw 4-byte ints, string lists as newline-joined UTF-8
+    '''
+    sections = []
+    for name in sorted(arrays):
+        sections.append((name, 'array', array_to_bytes(arrays[name]), len(arrays[name])))
+    for name in sorted(strings):
+        encoded = [s if isinstance(s, bytes) else s.encode('utf-8') for s in strings[name]]
+        sections.append((name, 'strings', b'\n'.join(encoded), len(encoded)))
+
+    header = {'array': {}, 'strings': {}}
+    offset = 0
+    for name, kind, data, length in sections:
+        header[kind][name] = [offset, len(data), length]
+        # keep every section 4-byte aligned
+        offset += len(data) + (-len(data) % 4)
+    header = json.dumps(header, sort_keys=True).encode('utf-8')
+    header += b' ' * (-(len(CACHE_MAGIC) + 4 + len(header)) % 4)
+
+    # write somewhere else first so a half-written file never looks like a cache entry
+    temp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(temp_path, 'wb') as f:
+        f.write(CACHE_MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for name, kind, data, length in sections:
+            f.write(data)
+            f.write(b'\0' * (-len(data) % 4))
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(temp_path, path)
+
+
+class PackedFile (object):
+    '''
+    Read side of write_packed. The file is memory-mapped, and a section is only read when it's asked for.
+    '''
+
+    def __init__ (self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(CACHE_MAGIC)] != CACHE_MAGIC:
+            raise ValueError('%s is not a cache file' % (path,))
+        start = len(CACHE_MAGIC) + 4
+        header_length = struct.unpack('<I', self.data[len(CACHE_MAGIC):start])[0]
+        self.header = json.loads(self.data[start:start + header_length].decode('utf-8'))
+        self.start = start + header_length
+
+    def section (self, kind, name):
+        offset, size, length = self.header[kind][name]
+        return self.data[self.start + offset:self.start + offset + size], length
+
+    def array (self, name, start=0, end=None):
+        # read all of an array, or just items start to end of it
+        offset, size, length = self.header['array'][name]
+        if end is None:
+            end = length
+        begin = self.start + offset
+        return array_from_bytes('i', self.data[begin + 4 * start:begin + 4 * end])
+
+    def strings (self, name):
+        data, length = self.section('strings', name)
+        if length == 0:
+            return []
+        strings = data.split(b'\n')
+        # Python 2 strings are bytes already
+        if bytes is not str:
+            strings = [s.decode('utf-8') for s in strings]
+        return strings
+
+
+def write_index (path, index):
+    '''
+    Saves an OccurrenceIndex with write_packed: its tokens in iteration order, and all of their sentence numbers in one
+    array, with offsets marking where each token's run starts.
+    '''
+    tokens = list(index)
+    offsets = array('i', [0])
+    ids = array('i')
+    for token in tokens:
+        ids.extend(index.sentence_ids(token))
+        offsets.append(len(ids))
+    write_packed (path, {'offsets': offsets, 'ids': ids}, {'tokens': tokens})
+
+
+class MappedIndex (object):
+    '''
+    A read-only OccurrenceIndex backed by a memory-mapped file from write_index. Tokens and counts are loaded up front;
+    each token's sentence numbers are only read from the file when asked for.
+    '''
+
+    def __init__ (self, path):
+        self.packed = PackedFile(path)
+        self.tokens = self.packed.strings('tokens')
+        self.offsets = self.packed.array('offsets')
+        self.positions = dict((token, i) for i, token in enumerate(self.tokens))
+
+    def count (self, token):
+        i = self.positions.get(token)
+        if i is None:
+            return 0
+        return self.offsets[i + 1] - self.offsets[i]
+
+    def sentence_ids (self, token):
+        # a fresh array of the sentence indices for token, read from the file, or an empty one
+        i = self.positions.get(token)
+        if i is None:
+            return array('i')
+        return self.packed.array('ids', self.offsets[i], self.offsets[i + 1])
+
+    def locations (self, token):
+        return list(self.sentence_ids(token))
+
+    def __contains__ (self, token):
+        return token in self.positions
+
+    def __len__ (self):
+        return len(self.tokens)
+
+    def __iter__ (self):
+        return iter(self.tokens)
+
+    def examples (self, min_count=2, exclude=()):
+        '''
+        Same as OccurrenceIndex.examples, in the same order the index was saved in.
+        '''
+        example_map = []
+        for i, k in enumerate(self.tokens):
+            start, end = self.offsets[i], self.offsets[i + 1]
+            if k not in exclude and end - start >= min_count:
+                example_map.append([k, list(self.packed.array('ids', start, end))])
+        return example_map
+
+
+class CorpusCache (object):
+    '''
+    An on-disk cache of parse_words, parse_ngrams and occurrence index outputs, so tuning the matching stage doesn't mean
+    re-parsing the corpora every run.
+
+    Example:
+    cache = CorpusCache('ioling-cache')
+    src_index = cache.index_puzzle(agk_prob_agk, gram_length=3)     # parsed and indexed the first time, read back after that
+    src_list = location_lists(src_index.examples())
+
+    inputs:
+        directory   <- where cache files go (created if it isn't there)
+        max_bytes   <- once the files in directory add up to more than this, the least recently used ones are deleted
+    builds:
+        one file per entry, named after the SHA-1 of the input text plus what was done to it (stage, gram_length ...),
+        in the write_packed format. Parsed sentences are stored CSR style (see pack_nested) and indexes as MappedIndex files.
+    '''
+
+    def __init__ (self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key (self, sentences, stage, params):
+        digest = hashlib.sha1()
+        digest.update(CACHE_KEY_VERSION)
+        digest.update(b'\0')
+        digest.update(repr((stage, sorted(params.items()))).encode('utf-8'))
+        # length-prefix every sentence, so no two different lists of sentences can hash the same bytes
+        # (just joining them on newlines made ['a\nb'] and ['a', 'b'] the same entry)
+        for s in sentences:
+            data = s if isinstance(s, bytes) else s.encode('utf-8')
+            digest.update(struct.pack('<I', len(data)))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def path (self, key):
+        return os.path.join(self.directory, key + '.iolc')
+
+    def lookup (self, key):
+        # hand back the cache file for key if there is one, marking it as just used
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        os.utime(path, None)
+        return path
+
+    def store (self, key, write):
+        # write is handed the path to save the new entry to
+        write (self.path(key))
+        self.evict()
+
+    def evict (self):
+        '''
+        Deletes the least recently used cache files until the rest fit in max_bytes.
+        '''
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.endswith('.iolc'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, name, stat.st_size))
+                total += stat.st_size
+        entries.sort()
+        for mtime, name, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+                total -= size
+            except OSError:
+                # still mapped somewhere (Windows); leave it for next time
+                pass
+
+    def nested (self, sentences, stage, params, depth, parse):
+        key = self.key(sentences, stage, params)
+        path = self.lookup(key)
+        if path is not None:
+            packed = PackedFile(path)
+            levels = [packed.array('level%d' % level) for level in range (0, depth - 1)]
+            return unpack_nested(packed.strings('strings'), levels, packed.array('ids'))
+        parsed = parse(sentences)
+        strings, levels, ids = pack_nested(parsed, depth)
+        arrays = {'ids': ids}
+        for level, offsets in enumerate(levels):
+            arrays['level%d' % level] = offsets
+        self.store (key, lambda path: write_packed(path, arrays, {'strings': strings}))
+        return parsed
+
+    def parse_words (self, sentence_list):
+        '''
+        Cached parse_words(sentence_list).
+        '''
+        sentences = list(sentence_list)
+        return self.nested(sentences, 'words', {}, 2, parse_words)
+
+    def parse_ngrams (self, sentence_list, gram_length=3, max_length=None):
+        '''
+        Cached parse_ngrams(parse_words(sentence_list), gram_length, max_length).
+        '''
+        sentences = list(sentence_list)
+        params = {'gram_length': gram_length, 'max_length': max_length}
+        return self.nested(sentences, 'ngrams', params, 3,
+                           lambda sentences: parse_ngrams(self.parse_words(sentences), gram_length, max_length))
+
+    def index (self, sentences, stage, params, build):
+        key = self.key(sentences, stage, params)
+        path = self.lookup(key)
+        if path is not None:
+            return MappedIndex(path)
+        index = build(sentences)
+        self.store (key, lambda path: write_index(path, index))
+        return index
+
+    def index_english (self, sentence_list):
+        '''
+        Cached index_english_sentences(parse_words(sentence_list)). Returns a MappedIndex when it comes from disk.
+        '''
+        sentences = list(sentence_list)
+        return self.index(sentences, 'english', {},
+                          lambda sentences: index_english_sentences(self.parse_words(sentences)))
+
+    def index_puzzle (self, sentence_list, gram_length=3, max_length=None):
+        '''
+        Cached index_puzzle_sentences(parse_ngrams(parse_words(sentence_list), gram_length, max_length)). Returns a
+        MappedIndex when it comes from disk.
+        '''
+        sentences = list(sentence_list)
+        params = {'gram_length': gram_length, 'max_length': max_length}
+        return self.index(sentences, 'puzzle', params,
+                          lambda sentences: index_puzzle_words(self.parse_words(sentences), gram_length, max_length))
+
+
+def common_prefix_length (a, b):
+    # how many chars a and b start with in common
+    n = min(len(a), len(b))
+    h = 0
+    while h < n and a[h] == b[h]:
+        h += 1
+    return h
+
+
+def index_maximal_repeats (word_list, gram_length=3):
+    '''
+    Takes a list of unknown sentences broken into words and finds every maximal repeated substring, using a suffix array
+    over the distinct words instead of listing every ngram of every word.
+
+    A substring is a maximal repeat when it occurs more than once and can't be stretched by a char on either side without
+    losing one of its occurrences. Every shorter gram that always shows up inside a longer one (same occurrences, same
+    sentences) is left out, which is what the commented-out clean-up in puzzle_sentences was after.
+
+    Example:
+    index_maximal_repeats( (('hoi', 'ton', 'dulon'), ('ho', 'ton', 'onon')) ).examples()   =>   [['ton', [0, 1]]]
+
+    inputs:
+        word_list   <- a list of sublists, where each sublist contains all of the words in a sentence (see parse_words)
+        gram_length <- the MIN length of repeats to report
+        NOTE repeats never run across words, but unlike word_grams they can be a whole word
+    builds:
+        suffixes    <- every distinct suffix of every distinct word, sorted (Python's own string sort does the work), each
+                       with the (word, start) pairs it comes from; a repeated word is only sorted once however often it occurs
+        entries     <- the suffix array of the text, squeezed down: one entry per distinct suffix, or two if it occurs more
+                       than once, since the extra copies never change which lcp intervals there are
+        lcp, left   <- for each entry, its common prefix with the entry before, and the char in front of its occurrences
+                       (or a one-off marker if they don't all have the same one)
+    returns:
+        index       <- an OccurrenceIndex mapping each maximal repeat to the sentence number of each of its occurrences
+
+    NOTE the cost goes with the number of distinct words times their length (plus the size of the result), not with the
+    length of the text, so this wins over gram enumeration whenever words repeat: on synthetic_corpus(5000) it takes
+    about half the time of parse_ngrams + puzzle_sentences at word_length=7, and a fifth at word_length=12. When nearly
+    every word is distinct (vocab_size as big as the text) the two come out about even
+    '''
+    # where every distinct word occurs: (position of its first char in the text, sentence number), in text order.
+    # Positions count one slot per word for the gap in front of it, so no two words ever run together
+    occurrences = {}
+    position = 0
+    for sentence_id, sentence in enumerate(word_list):
+        for w in sentence:
+            position += 1
+            occurrences.setdefault(w, []).append((position, sentence_id))
+            position += len(w)
+
+    sources = {}
+    for w in occurrences:
+        for start in range (0, len(w)):
+            sources.setdefault(w[start:], []).append((w, start))
+    suffixes = sorted(sources)
+
+    entries = []
+    lcp = []
+    left = []
+    previous = ''
+    for suffix_id, suffix in enumerate(suffixes):
+        pairs = sources[suffix]
+        weight = 0
+        lefts = set()
+        for w, start in pairs:
+            weight += len(occurrences[w])
+            # a word start has the gap in front of it, which is different for every occurrence
+            lefts.add(w[start - 1] if start > 0 else None)
+        same_left = len(lefts) == 1 and None not in lefts
+        entries.append(suffix_id)
+        lcp.append(common_prefix_length(previous, suffix))
+        left.append(lefts.pop() if same_left else -len(left) - 1)
+        if weight > 1:
+            entries.append(suffix_id)
+            lcp.append(len(suffix))
+            left.append(left[-1] if same_left else -len(left) - 1)
+        previous = suffix
+
+    # a repeat is left-maximal unless all its occurrences have the same char in front of them; counting the places where
+    # that char changes between neighbouring entries lets us check any run of them in one subtraction
+    n = len(entries)
+    changes = [0] * (n + 1)
+    for j in range(1, n):
+        changes[j] = changes[j - 1] + (left[j] != left[j - 1])
+
+    # walk the lcp intervals bottom-up; each one is a group of suffixes sharing exactly their first `length` chars
+    repeats = []
+    stack = [[0, 0]]
+    for j in range(1, n + 1):
+        h = lcp[j] if j < n else 0
+        lb = j - 1
+        while h < stack[-1][0]:
+            length, lb = stack.pop()
+            rb = j - 1
+            if length >= gram_length and changes[rb] - changes[lb] > 0:
+                found = []
+                for suffix_id in sorted(set(entries[lb:rb + 1])):
+                    for w, start in sources[suffixes[suffix_id]]:
+                        for p, sentence_id in occurrences[w]:
+                            found.append((p + start, sentence_id))
+                found.sort()
+                repeats.append((found[0][0], -length, suffixes[entries[lb]][:length], found))
+        if h > stack[-1][0]:
+            stack.append([h, lb])
+
+    # list the repeats in the order they first show up in the text, longest first
+    repeats.sort()
+    index = OccurrenceIndex()
+    for first, length, gram, found in repeats:
+        for p, sentence_id in found:
+            index.add (gram, sentence_id)
+    return index
+
+
+def puzzle_repeats (word_list, gram_length=3):
+    '''
+    Suffix-array counterpart of puzzle_sentences(parse_ngrams(word_list, gram_length)): the distinct location lists of the
+    maximal repeats in the unknown sentences (see index_maximal_repeats), ready for deg_separ_matcher.
+    '''
+    return location_lists(index_maximal_repeats(word_list, gram_length).examples())
+
+
+def cooccurrence_graph (loc_list):
+    '''
+    Takes a list of lists of occurrence locations and links up every pair of numbers that occur in the same list at any point.
+
+    Example:
+    cooccurrence_graph( [[0,1,3],[0,2,4]] )   =>   ( {0: [1, 3, 2, 4], 1: [0, 3], ...} , {0: set([1, 2, 3, 4]), 1: set([0, 3]), ...} )
+
+    inputs:
+        loc_list        <-  a list of sublists, where each sublist is a collection of locations where a word/ngram match was found
+    outputs:
+        pattern_dict    <-  a dictionary mapping each num to the other nums it cooccurs with, in the order they were first found
+        pattern_sets    <-  the same cooccurrences as sets, for constant-time "does x occur with y?" checks
+
+    facilitates:
+        walking the cooccurrence branches in deg_separ_matcher without rescanning lists
+    '''
+    pattern_dict = {}
+    pattern_sets = {}
+
+    # create a basic dictionary associating each num with other nums that occur in same list at any point
+    for locations in loc_list:
+    # drill into list of nums
+        for loc in locations:
+        # drill down to nums themselves
+            # create a list of locations that cooccur with loc
+            if loc not in pattern_dict:
+            # new dictionary entry if num isn't already a key
+                pattern_dict[loc] = []
+                pattern_sets[loc] = set()
+            neighbours = pattern_sets[loc]
+            for loc2 in locations:
+            # add nums that aren't already in that value and that aren't identical to the key (keys always occur with themselves in a list!)
+                if loc2 != loc and loc2 not in neighbours:
+                    neighbours.add(loc2)
+                    pattern_dict[loc].append (loc2)
+
+    return pattern_dict, pattern_sets
+
+
+def deg_branches (loc, pattern_dict, pattern_sets):
+    '''
+    Builds the [lvl_1, lvl_2, lvl_3] decision tree for a single num out of a cooccurrence graph (see deg_separ_matcher).
+
+    inputs:
+        loc             <-  the num under consideration
+        pattern_dict    <-  ordered cooccurrences, as returned by cooccurrence_graph
+        pattern_sets    <-  the same cooccurrences as sets
+    outputs:
+        total           <-  [lvl_1, lvl_2, lvl_3] for loc
+
+    NOTE that lvl_1_seen and lvl_2_seen grow right alongside lvl_1 and lvl_2, so "not already in this branch" means
+    exactly what it did when it was checked against the lists themselves.
+    '''
+    lvl_1 = []
+    lvl_2 = []
+    lvl_3 = []
+    lvl_1_seen = set()
+    lvl_2_seen = set()
+    # everything that cooccurs with loc; "does loc occur with x?" is the same question since cooccurrence goes both ways
+    loc_set = pattern_sets[loc]
+
+    # dig into the first branch. All these cooccur with loc, so pass Y for each
+    for coloc in pattern_dict[loc]:
+        lvl_1.append('Y')
+        lvl_1.append(coloc)
+        lvl_1_seen.add(coloc)
+        #dig into the 2nd branch. Check if the number in question occurs within the coloc's list
+        for sub_coloc in pattern_dict[coloc]:
+            # is the original num in the list of nums that occur (sub_colocs) with the nums that occur (colocs) with the original num?
+            if sub_coloc not in lvl_1_seen:
+                if sub_coloc in loc_set:
+                    lvl_2.append('Y')
+                else:
+                    lvl_2.append('N')
+                lvl_2.append(sub_coloc)
+                lvl_2_seen.add(sub_coloc)
+            #dig into the 3rd branch. Check if the number in question occurs within the sub_coloc's list
+            for sub_sub_coloc in pattern_dict[sub_coloc]:
+            # is the original num in the list of nums that occur (sub_sub_colocs) with the numbs that cooccur (sub_colocs) with the nums that cooccur (colocs) with the original num?
+                if sub_sub_coloc not in lvl_2_seen:
+                    if sub_sub_coloc in loc_set:
+                        lvl_3.append('Y')
+                    else:
+                        lvl_3.append('N')
+
+    return [lvl_1, lvl_2, lvl_3]
+
+
+def deg_signatures_counts (loc_list):
+    '''
+    Computes the order-free deg_signature of every num in a list of location lists from degree, triangle and walk counts,
+    in plain Python. Gives exactly what deg_signatures_sparse gives, for when NumPy/SciPy aren't installed.
+
+    Example:
+    deg_signatures_counts( [[0,1,3],[0,2,4]] )[1]   =>   (2, 0, 1, 4, 8, 4)
+
+    inputs:
+        loc_list    <-  a list of sublists, where each sublist is a collection of locations where a word/ngram match was found
+    outputs:
+        signatures  <-  a dictionary mapping each num to (lvl_1 Ys, lvl_1 Ns, lvl_2 Ys, lvl_2 Ns, lvl_3 Ys, lvl_3 Ns), where
+                        lvl_1 Ys = how many nums occur with it
+                        lvl_2 Ys = how many pairs of those also occur with each other (its triangles)
+                        lvl_2 Ns = every other step out from lvl_1
+                        lvl_3 Ys = three-step walks that end on a num that occurs with it
+                        lvl_3 Ns = three-step walks that end anywhere else but back on the num itself
+            NOTE that the lvl_1 and lvl_2 counts are exactly what deg_separ_matcher walks out. Its lvl_3 depends on the order
+            the branches are walked in (a num is skipped once it's been listed in lvl_2 so far), so it can't be counted
+            this way; these lvl_3 counts are the order-free version, and the two kinds shouldn't be mixed in one comparison
+    '''
+    pattern_dict, pattern_sets = cooccurrence_graph(loc_list)
+    degrees = dict((loc, len(neighbours)) for loc, neighbours in pattern_sets.items())
+    # two-step walks out of each num: the sum of its neighbours' degrees
+    walks_2 = dict((loc, sum(degrees[coloc] for coloc in neighbours)) for loc, neighbours in pattern_sets.items())
+
+    signatures = {}
+    for loc, neighbours in pattern_sets.items():
+        # how many two-step walks go from loc to each num
+        reach = {}
+        for coloc in neighbours:
+            for sub_coloc in pattern_sets[coloc]:
+                reach[sub_coloc] = reach.get(sub_coloc, 0) + 1
+        # walks that come back to loc after 3 steps close a triangle; each one is found from both ends
+        closed = sum(reach.get(coloc, 0) for coloc in neighbours)
+        # 3-step walks that end next to loc are the same as pairs of 2-step walks meeting in the middle
+        lvl_3_y = sum(count * count for count in reach.values())
+        walks_3 = sum(walks_2[coloc] for coloc in neighbours)
+        signatures[loc] = (degrees[loc], 0, closed // 2, walks_2[loc] - closed, lvl_3_y, walks_3 - lvl_3_y - closed)
+    return signatures
+
+
+def deg_signatures_sparse (loc_list):
+    '''
+    Computes the same signatures as deg_signatures_counts straight from sparse matrix products, without walking any
+    branches in Python. Needs NumPy and SciPy.
+
+    Example:
+    deg_signatures_sparse( [[0,1,3],[0,2,4]] )[1]   =>   (2, 0, 1, 4, 8, 4)
+
+    inputs:
+        loc_list    <-  a list of sublists, where each sublist is a collection of locations where a word/ngram match was found
+    builds:
+        A           <-  the cooccurrence graph as a sparse 0/1 matrix (A[i,j] = 1 if nums i and j occur in the same list)
+    outputs:
+        signatures  <-  a dictionary mapping each num to (lvl_1 Ys, lvl_1 Ns, lvl_2 Ys, lvl_2 Ns, lvl_3 Ys, lvl_3 Ns), where
+                        lvl_1 Ys = row sums of A (degrees)
+                        lvl_2 Ys = diagonal of A^3, halved
+                        lvl_2 Ns = A . degrees - diagonal of A^3
+                        lvl_3 Ys = row sums of A^2 * A^2 (elementwise), which is the diagonal of A^4
+                        lvl_3 Ns = A . A . degrees - lvl_3 Ys - diagonal of A^3
+            NOTE that A^3 and A^4 are never built; only A^2 is
+
+    facilitates:
+        running deg_separ_matcher over large location sets
+    '''
+    # NumPy and SciPy are only needed here, so they're imported on first use instead of slowing down every start
+    import numpy
+    from scipy import sparse
+
+    # number the nums in the order they're first found
+    node_ids = {}
+    nodes = []
+    rows = []
+    cols = []
+    for list_id, locations in enumerate(loc_list):
+        for loc in locations:
+            if loc not in node_ids:
+                node_ids[loc] = len(nodes)
+                nodes.append(loc)
+            rows.append(list_id)
+            cols.append(node_ids[loc])
+
+    # incidence of nums in lists; two nums cooccur when they share a list, and nobody cooccurs with themselves
+    incidence = sparse.csr_matrix((numpy.ones(len(rows), dtype=numpy.int64), (rows, cols)), shape=(len(loc_list), len(nodes)))
+    A = (incidence.T * incidence).tocsr()
+    A.setdiag(0)
+    A.eliminate_zeros()
+    A.data[:] = 1
+
+    A2 = A * A
+    degrees = numpy.asarray(A.sum(axis=1)).ravel()
+    walks_2 = A.dot(degrees)
+    walks_3 = A.dot(walks_2)
+
+    # walks that come back to the original num after 3 steps close a triangle; each one is found from both ends
+    closed = numpy.asarray(A2.multiply(A).sum(axis=1)).ravel()
+    lvl_2_y = closed // 2
+    lvl_2_n = walks_2 - closed
+
+    # 3-step walks either end next to the original num (Y), back on it, or anywhere else (N)
+    lvl_3_y = numpy.asarray(A2.multiply(A2).sum(axis=1)).ravel()
+    lvl_3_n = walks_3 - lvl_3_y - closed
+
+    signatures = {}
+    for i, loc in enumerate(nodes):
+        signatures[loc] = (int(degrees[i]), 0, int(lvl_2_y[i]), int(lvl_2_n[i]), int(lvl_3_y[i]), int(lvl_3_n[i]))
+    return signatures
+
+
+def deg_separ_matcher (loc_list, backend='python'):
+    '''
+    Takes a list of lists of occurrence locations searches it for degree-of-separation patterns (do numbers that occur with numbers that occur with me also occur with me?).
+        
+    inputs:
+        loc_list    <-  a list of sublists, where each sublist is a collection of locations where a word/ngram match was found
+        backend     <-  'python' walks every branch and returns the full decision trees described below
+                        'sparse' returns only the order-free deg_signature of each tree, computed with sparse matrices (see deg_signatures_sparse)
+                        NOTE that 'sparse' falls back to deg_signatures_counts, which counts the same thing in plain Python,
+                        when NumPy/SciPy aren't installed
+    outputs:
+        decision    <-  a dictionary mapping to a decision tree, where each
+                        KEY     is the number under consideration in a location list, and
+                        VALUE   is a list of n-branch depth searches for numbers that occur in any list with the previous branching number, along with Y or N for whether that number also occurs in any list with the original KEY number
+
+            e.g. traversing [[0,1,3],[0,2,4]], looking at the key 1:
+
+                          1            1
+                         / \          / \
+                        0   3        Y   Y
+                       / \          / \
+                      2   4        N  N
+
+                    yields the entry    1: [[Y,Y],[N,N]]
+
+    facilitates:
+        matching patterns between distinct sets of numbers, where the pattern of cooccurrences has strict logical coherence, but the mapping between numbers is unknown
+    '''
+
+    if backend == 'sparse':
+        try:
+            return deg_signatures_sparse(loc_list)
+        except ImportError:
+            # no NumPy/SciPy here; count the same signatures in Python instead (never the walk, whose lvl_3 is different)
+            return deg_signatures_counts(loc_list)
+    elif backend != 'python':
+        raise ValueError('unknown deg_separ_matcher backend: %r' % (backend,))
+
+    pattern_dict, pattern_sets = cooccurrence_graph(loc_list)
+
+    # take pattern dictionary above and branch patterns based on degree of separation of cooccurrences
+    solutions_dict = {}
+    for loc in pattern_dict:
+        solutions_dict[loc] = deg_branches(loc, pattern_dict, pattern_sets)
+
+    return solutions_dict
+
+def deg_signature (branches):
+    '''
+    Boils one deg_separ_matcher entry down to a fixed signature: how many Y's and N's show up on each level of the tree.
+
+    Example:
+    deg_signature( [['Y', 0, 'Y', 3], ['N', 2, 'N', 4], ['Y', 'N', 'N']] )   =>     (2, 0, 0, 2, 1, 2)
+
+    inputs:
+        branches    <- a [lvl_1, lvl_2, lvl_3] value out of deg_separ_matcher
+                       (the sparse backend already hands back signatures, which are passed straight through)
+    outputs:
+        signature   <- a tuple of (lvl_1 Ys, lvl_1 Ns, lvl_2 Ys, lvl_2 Ns, lvl_3 Ys, lvl_3 Ns)
+
+    facilitates:
+        comparing decision trees by hashing, instead of recounting the branches for every pair
+    '''
+    if isinstance(branches, tuple):
+        return branches
+    signature = []
+    for level in branches:
+        signature.append(level.count('Y'))
+        signature.append(level.count('N'))
+    return tuple(signature)
+
+def signature_items (decision):
+    '''
+    Reduces every entry of a deg_separ_matcher dictionary to its deg_signature, and works out which backend made them.
+
+    inputs:
+        decision    <- a dictionary as returned by deg_separ_matcher
+    outputs:
+        backend     <- 'python' for walked decision trees, 'sparse' for order-free signatures (None if decision is empty)
+        items       <- a list of (key, signature) pairs, in decision's order
+    raises:
+        ValueError if decision mixes the two; their lvl_3 counts mean different things (see deg_signatures_counts)
+    '''
+    backend = None
+    items = []
+    for key, value in decision.items():
+        kind = 'sparse' if isinstance(value, tuple) else 'python'
+        if backend is None:
+            backend = kind
+        elif kind != backend:
+            raise ValueError('deg_separ_matcher output mixes walked trees and order-free signatures (key %r)' % (key,))
+        items.append((key, deg_signature(value)))
+    return backend, items
+
+
+def signature_pairs (d1, d2):
+    # signature_items for both sides, refusing to compare output of one backend with output of the other
+    backend_1, items_1 = signature_items(d1)
+    backend_2, items_2 = signature_items(d2)
+    if backend_1 is not None and backend_2 is not None and backend_1 != backend_2:
+        raise ValueError('cannot compare %r backend signatures with %r backend signatures' % (backend_1, backend_2))
+    return items_1, items_2
+
+## write funct that compares 2 dictionaries to determine which keys have the same values, and pair those keys
+def dict_compar (d1, d2):
+    '''
+    Pairs up the keys of two deg_separ_matcher dictionaries whose decision trees have the same number of Y's and N's on every level.
+
+    inputs:
+        d1, d2      <- dictionaries as returned by deg_separ_matcher, both from the same backend
+    outputs:
+        matches     <- a list of [k1, k2] pairs, in d1 order and then d2 order
+    raises:
+        ValueError if the two dictionaries (or the entries of either one) come from different backends
+
+    Each tree is reduced to its deg_signature once, and d2's keys are bucketed by signature, so every key in d1
+    only gets compared with the keys in d2 that already match it.
+    '''
+    items_1, items_2 = signature_pairs(d1, d2)
+
+    # bucket the keys of d2 by signature, keeping d2's own order inside each bucket
+    buckets = {}
+    for k2, s2 in items_2:
+        buckets.setdefault(s2, []).append(k2)
+
+    matches = []
+    for k1, s1 in items_1:
+        for k2 in buckets.get(s1, ()):
+            matches.append ([k1, k2])
+    return matches
+
+def signature_distance (s1, s2, bound=None):
+    '''
+    How far apart two deg_signatures are: the sum of the differences between their Y and N counts on every level.
+
+    Example:
+    signature_distance( (2, 0, 1, 4, 6, 1) , (2, 0, 0, 4, 8, 1) )   =>   3
+
+    inputs:
+        s1, s2  <- signatures, as returned by deg_signature
+        bound   <- give up as soon as the distance gets past this (the partial sum is returned, which is already > bound)
+    '''
+    distance = 0
+    for a, b in zip(s1, s2):
+        distance += a - b if a > b else b - a
+        if bound is not None and distance > bound:
+            break
+    return distance
+
+
+def top_k_matches (d1, d2, k=3, max_distance=None):
+    '''
+    Ranks, for every key in d1, the k keys in d2 whose decision trees are closest to it, where dict_compar only pairs up
+    exact matches.
+
+    Example:
+    top_k_matches( {0: (2, 0, 1, 4, 6, 1)} , {5: (2, 0, 1, 4, 6, 1), 6: (2, 0, 1, 4, 9, 1), 7: (1, 0, 0, 2, 2, 0)} , k=2 )
+        =>   [[0, 5, 0], [0, 6, 3]]
+
+    inputs:
+        d1, d2          <- dictionaries as returned by deg_separ_matcher (either backend, as long as both use the same one;
+                           ValueError otherwise, as in dict_compar)
+        k               <- how many candidates to keep per key in d1
+        max_distance    <- leave out candidates further away than this (None means no limit)
+    outputs:
+        ranked          <- a list of [k1, k2, distance] items: d1's keys in d1 order, each followed by its candidates best
+                           first (ties go to whichever key came first in d2)
+
+    Not every pair gets scored. d2's keys are bucketed by signature and the buckets sorted by the total of their counts;
+    two signatures can't be closer than the difference of their totals, so the search walks outwards from each key's
+    own total and stops once that difference can't beat the k-th best candidate so far. Distances are cut short
+    against the same bound (see signature_distance).
+    '''
+    items_1, items_2 = signature_pairs(d1, d2)
+
+    # bucket d2 by signature, keeping d2's order inside each bucket
+    buckets = {}
+    for position, (k2, s2) in enumerate(items_2):
+        buckets.setdefault(s2, []).append((position, k2))
+    candidates = sorted((sum(signature), signature) for signature in buckets)
+
+    ranked = []
+    for k1, s1 in items_1:
+        for k2, distance in nearest_keys(s1, candidates, buckets, k, max_distance):
+            ranked.append ([k1, k2, distance])
+    return ranked
+
+
+def nearest_keys (s1, candidates, buckets, k, max_distance=None):
+    '''
+    The search behind top_k_matches, for a single signature.
+
+    inputs:
+        s1              <- the signature to find neighbours for
+        candidates      <- a sorted list of (total of the counts, signature) for every signature to search
+        buckets         <- a dictionary mapping each of those signatures to a list of (position, key), sorted by position;
+                           ties in distance go to the lowest position
+        k, max_distance <- see top_k_matches
+    outputs:
+        nearest         <- a list of up to k [key, distance] items, best first
+    '''
+    if k <= 0:
+        return []
+    total = sum(s1)
+    # max-heap (by negating) of the k best so far, so the worst of them is always on top
+    best = []
+    above = bisect.bisect_left(candidates, (total,))
+    below = above - 1
+    while below >= 0 or above < len(candidates):
+        # take whichever side is closer in total; that difference is a lower bound on everything left
+        if above >= len(candidates) or (below >= 0 and total - candidates[below][0] <= candidates[above][0] - total):
+            lower, s2 = total - candidates[below][0], candidates[below][1]
+            below -= 1
+        else:
+            lower, s2 = candidates[above][0] - total, candidates[above][1]
+            above += 1
+        bound = max_distance
+        if len(best) == k:
+            bound = -best[0][0] if bound is None else min(bound, -best[0][0])
+        if bound is not None and lower > bound:
+            break
+        distance = signature_distance(s1, s2, bound)
+        if bound is not None and distance > bound:
+            continue
+        for position, key in buckets[s2]:
+            entry = (-distance, -position, key)
+            if len(best) < k:
+                heapq.heappush(best, entry)
+            elif entry > best[0]:
+                heapq.heapreplace(best, entry)
+            else:
+                # the rest of the bucket comes later, so it can't do any better
+                break
+    return [[key, -distance] for distance, position, key in sorted(best, reverse=True)]
+
+
+def assign_matches (ranked):
+    '''
+    Turns the candidates from top_k_matches into a one-to-one pairing: the closest pairs are taken first, and a key on
+    either side is never used twice.
+
+    inputs:
+        ranked  <- a list of [k1, k2, distance] items, as returned by top_k_matches
+    outputs:
+        matches <- the [k1, k2, distance] items that were kept, closest first (ties keep the order they had in ranked)
+    '''
+    used_1 = set()
+    used_2 = set()
+    matches = []
+    for k1, k2, distance in sorted(ranked, key=lambda item: item[2]):
+        if k1 not in used_1 and k2 not in used_2:
+            used_1.add(k1)
+            used_2.add(k2)
+            matches.append ([k1, k2, distance])
+    return matches
+
+
+class IncrementalCorpus (object):
+    '''
+    A corpus that grows one sentence at a time. It keeps the token postings, the cooccurrence graph and the
+    deg_signatures up to date in place, so appending a sentence only redoes the work that sentence touches.
+
+    Example:
+    corpus = IncrementalCorpus('english')
+    for s in agk_prob_en:
+        changed = corpus.add_sentence(s)          # the nums whose signatures may have moved
+    corpus.signatures()     =>      the same as deg_signatures_counts(english_sentences(parse_words(agk_prob_en)))
+
+    inputs:
+        kind        <- 'english' (words plus stems, as english_sentences) or 'puzzle' (ngrams, as puzzle_sentences)
+        gram_length, max_length <- the ngram lengths for 'puzzle' (see word_grams)
+        stop_words  <- tokens left out of the graph for 'english' (defaults to STOP_WORDS)
+        stemmer     <- the Stemmer for 'english' (defaults to ENGLISH_STEMMER)
+        exact       <- False (the default) keeps the order-free signatures of deg_signatures_counts / the 'sparse'
+                       backend; True gives the walked signatures of the 'python' backend instead (see the NOTEs)
+    builds:
+        symbols, postings <- the tokens added so far and the sentence indices of each, as in OccurrenceIndex before it
+                           went CSR: one growable array per token id, since sentences never stop coming here
+        sentence_tokens <- for each sentence, a sorted array of the distinct token ids in it
+        neighbours      <- the pattern_dict of cooccurrence_graph over every token that occurs more than once
+        neighbour_sets  <- the same cooccurrences as sets
+        first_tokens    <- for each num, the id of the token that first linked it to each of its neighbours, in the same
+                           order as its neighbours (so never decreasing); it says where a new neighbour goes in the list
+        triangles       <- for each num, how many pairs of its neighbours occur with each other (its lvl_2 Ys)
+        walks_2         <- for each num, the sum of its neighbours' degrees (its two-step walks)
+        walks_3         <- for each num, the sum of its neighbours' walks_2 (its three-step walks)
+        reach           <- for each num, how many two-step walks go from it to each num, as in deg_signatures_counts
+        lvl_3_y         <- for each num, the sum of the squares of its reach counts (its order-free lvl_3 Ys)
+        buckets, candidates <- the signatures laid out for nearest_keys, so other corpora can query this one
+
+    NOTE that the graph is built from every token that occurs more than once, so it matches puzzle_sentences without
+    prune and english_sentences with this stop_words list.
+    NOTE every counter behind the order-free signature is updated in place as links are added: triangles and reach
+    cost about the degrees of the two ends of each new link, and the change in walks_2 is passed on to walks_3 once per
+    sentence. A signature is then rebuilt from its counters in constant time, for just the nums those counters moved.
+    NOTE with exact=True, lvl_3 is walked out with deg_branches, whose result depends on the order the branches are
+    walked in, so it can't be updated from counts; every num within 2 links of the new sentence or its neighbours is
+    walked again. On a connected corpus that is usually all of it, i.e. the same cost as a full deg_separ_matcher rebuild
+    '''
+
+    def __init__ (self, kind='puzzle', gram_length=3, max_length=None, stop_words=STOP_WORDS, stemmer=None, exact=False):
+        if kind not in ('english', 'puzzle'):
+            raise ValueError('unknown IncrementalCorpus kind: %r' % (kind,))
+        self.kind = kind
+        self.gram_length = gram_length
+        self.max_length = max_length
+        self.stop_words = frozenset(stop_words) if kind == 'english' else frozenset()
+        self.stemmer = ENGLISH_STEMMER if stemmer is None else stemmer
+        self.exact = exact
+        self.symbols = SymbolTable()
+        self.postings = []
+        self.sentence_tokens = []
+        self.excluded = set()
+        self.neighbours = {}
+        self.neighbour_sets = {}
+        self.first_tokens = {}
+        self.triangles = {}
+        self.walks_2 = {}
+        self.walks_3 = {}
+        self.reach = {}
+        self.lvl_3_y = {}
+        self.cached = {}
+        self.dirty = set()
+        self.buckets = {}
+        self.candidates = []
+
+    def __len__ (self):
+        return len(self.sentence_tokens)
+
+    def tokens (self, sentence):
+        # the same tokens, in the same order, that english_sentences / puzzle_sentences would add for this sentence
+        words = parse_words([sentence])[0]
+        if self.kind == 'english':
+            for word in words:
+                yield word
+                for stem in self.stemmer.stems(word):
+                    yield stem
+        else:
+            for word in words:
+                for gram in word_grams(word, self.gram_length, self.max_length):
+                    yield gram
+
+    def linked (self, token_id):
+        # does this token make links in the graph? (it has to occur more than once, and not be a stop word)
+        return token_id not in self.excluded and len(self.postings[token_id]) >= 2
+
+    def add_node (self, loc):
+        if loc not in self.neighbour_sets:
+            self.neighbours[loc] = []
+            self.neighbour_sets[loc] = set()
+            self.first_tokens[loc] = array('i')
+            self.triangles[loc] = 0
+            self.walks_2[loc] = 0
+            self.walks_3[loc] = 0
+            self.reach[loc] = {}
+            self.lvl_3_y[loc] = 0
+
+    def add_walks (self, loc, others):
+        # one more two-step walk from loc to each of others (and back), and from loc to itself: the walks that go
+        # across a new link to loc's far end and on from there. A count going from c to c + 1 adds 2c + 1 to its square
+        reach = self.reach
+        lvl_3_y = self.lvl_3_y
+        row = reach[loc]
+        added = 0
+        for coloc in others:
+            count = row.get(coloc, 0)
+            row[coloc] = count + 1
+            added += 2 * count + 1
+            other_row = reach[coloc]
+            count = other_row.get(loc, 0)
+            other_row[loc] = count + 1
+            lvl_3_y[coloc] += 2 * count + 1
+        count = row.get(loc, 0)
+        row[loc] = count + 1
+        lvl_3_y[loc] += added + 2 * count + 1
+
+    def link (self, loc, loc2, walks_2_delta):
+        '''
+        Adds a link between two nums that weren't linked yet, keeping the triangle, two-step walk and reach counters
+        right, and adding every change to walks_2 into walks_2_delta (see add_sentence for walks_3). Costs about the
+        degrees of the two nums.
+        '''
+        loc_set = self.neighbour_sets[loc]
+        loc2_set = self.neighbour_sets[loc2]
+        # every neighbour they share closes a new triangle with the link
+        if len(loc_set) > len(loc2_set):
+            smaller, bigger = loc2_set, loc_set
+        else:
+            smaller, bigger = loc_set, loc2_set
+        shared = [coloc for coloc in smaller if coloc in bigger]
+        self.triangles[loc] += len(shared)
+        self.triangles[loc2] += len(shared)
+        for coloc in shared:
+            self.triangles[coloc] += 1
+        # the new two-step walks are the ones with the link as either step
+        self.add_walks (loc2, loc_set)
+        self.add_walks (loc, loc2_set)
+        # both degrees go up by one, which every one of their neighbours sees two steps out
+        walks_2 = self.walks_2
+        for coloc in loc_set:
+            walks_2[coloc] += 1
+            walks_2_delta[coloc] = walks_2_delta.get(coloc, 0) + 1
+        for coloc in loc2_set:
+            walks_2[coloc] += 1
+            walks_2_delta[coloc] = walks_2_delta.get(coloc, 0) + 1
+        loc_set.add(loc2)
+        loc2_set.add(loc)
+        walks_2[loc] += len(loc2_set)
+        walks_2_delta[loc] = walks_2_delta.get(loc, 0) + len(loc2_set)
+        walks_2[loc2] += len(loc_set)
+        walks_2_delta[loc2] = walks_2_delta.get(loc2, 0) + len(loc_set)
+
+    def add_sentence (self, sentence):
+        '''
+        Appends one sentence to the corpus.
+
+        inputs:
+            sentence    <- a raw sentence, as it would appear in the list handed to parse_words
+        outputs:
+            changed     <- the set of nums whose signatures may be different now (the new sentence, if it's in the
+                           graph at all, and the nums whose counters it moved; with exact=True, everything within 3
+                           links of it)
+        '''
+        sentence_id = len(self.sentence_tokens)
+        token_ids = set()
+        for token in self.tokens(sentence):
+            token_id = self.symbols.intern(token)
+            if token_id == len(self.postings):
+                self.postings.append(array('i'))
+            self.postings[token_id].append(sentence_id)
+            if token_id not in token_ids:
+                token_ids.add(token_id)
+                if token in self.stop_words:
+                    self.excluded.add(token_id)
+        sentence_tokens = array('i', sorted(token_ids))
+        self.sentence_tokens.append(sentence_tokens)
+
+        # build the new sentence's list the way cooccurrence_graph would: tokens in first-seen order, then sentence order.
+        # Links only ever appear between the new sentence and the ones sharing a token with it
+        in_graph = False
+        neighbours = []
+        first_tokens = array('i')
+        seen = set()
+        for token_id in sentence_tokens:
+            if self.linked(token_id):
+                in_graph = True
+                for loc in self.postings[token_id]:
+                    if loc != sentence_id and loc not in seen:
+                        seen.add(loc)
+                        neighbours.append(loc)
+                        first_tokens.append(token_id)
+        if not in_graph:
+            return set()
+
+        self.add_node (sentence_id)
+        # the new sentence has no two-step walks yet, so its links only bring its neighbours' walks_2 from before this
+        # sentence into its walks_3; anything the links add on top comes through walks_2_delta below
+        walks_3_new = sum(self.walks_2.get(loc, 0) for loc in neighbours)
+        walks_2_delta = {}
+        for i, loc in enumerate(neighbours):
+            self.add_node (loc)
+            # the new sentence goes in right after everything loc got from tokens up to the first one they share;
+            # it's the last sentence, so it comes after the rest of that token's sentences too
+            token_id = first_tokens[i]
+            position = bisect.bisect_right(self.first_tokens[loc], token_id)
+            self.neighbours[loc].insert(position, sentence_id)
+            self.first_tokens[loc].insert(position, token_id)
+            self.link (sentence_id, loc, walks_2_delta)
+        self.neighbours[sentence_id] = neighbours
+        self.first_tokens[sentence_id] = first_tokens
+
+        # every change in a num's two-step walks shows up in all its neighbours' three-step walks
+        walks_3 = self.walks_3
+        walks_3[sentence_id] += walks_3_new
+        changed = set(walks_2_delta)
+        changed.add(sentence_id)
+        for loc, delta in walks_2_delta.items():
+            loc_set = self.neighbour_sets[loc]
+            for coloc in loc_set:
+                walks_3[coloc] += delta
+            changed.update(loc_set)
+
+        if self.exact:
+            # a deg_branches walk reads the lists of its num and of everything up to 2 links away, so those are the ones to redo
+            touched = set(neighbours)
+            touched.add(sentence_id)
+            changed = set()
+            frontier = touched
+            for depth in range (2):
+                changed.update(frontier)
+                next_frontier = set()
+                for loc in frontier:
+                    next_frontier.update(self.neighbour_sets[loc])
+                frontier = next_frontier - changed
+            changed.update(frontier)
+        self.dirty.update(changed)
+        return changed
+
+    def add_sentences (self, sentences):
+        changed = set()
+        for sentence in sentences:
+            changed.update(self.add_sentence(sentence))
+        return changed
+
+    def update (self, loc):
+        # rebuild loc's signature and move it to the bucket for it
+        self.dirty.discard(loc)
+        if self.exact:
+            signature = deg_signature(deg_branches(loc, self.neighbours, self.neighbour_sets))
+        else:
+            # the same counts deg_signatures_counts makes, straight from the counters
+            triangles = self.triangles[loc]
+            lvl_3_y = self.lvl_3_y[loc]
+            signature = (len(self.neighbour_sets[loc]), 0, triangles, self.walks_2[loc] - 2 * triangles,
+                         lvl_3_y, self.walks_3[loc] - lvl_3_y - 2 * triangles)
+        old = self.cached.get(loc)
+        if old == signature:
+            return signature
+        if old is not None:
+            bucket = self.buckets[old]
+            bucket.remove((loc, loc))
+            if not bucket:
+                del self.buckets[old]
+                self.candidates.remove((sum(old), old))
+        self.cached[loc] = signature
+        if signature not in self.buckets:
+            self.buckets[signature] = []
+            bisect.insort(self.candidates, (sum(signature), signature))
+        bisect.insort(self.buckets[signature], (loc, loc))
+        return signature
+
+    def refresh (self):
+        for loc in list(self.dirty):
+            self.update (loc)
+
+    def signature (self, loc):
+        # loc's deg_signature, or None if loc has no tokens that occur more than once (it isn't in the graph)
+        if loc in self.dirty:
+            return self.update(loc)
+        return self.cached.get(loc)
+
+    def signatures (self):
+        # a copy of every num's signature, as deg_separ_matcher would give them with the 'sparse' backend
+        # (or, with exact=True, as {k: deg_signature(v)} over the 'python' one)
+        if self.dirty:
+            self.refresh()
+        return dict(self.cached)
+
+    def check_comparable (self, other):
+        # only signatures of the same kind can be compared (see signature_pairs); brings other's buckets up to date
+        if other.exact != self.exact:
+            raise ValueError('cannot compare an exact IncrementalCorpus with an order-free one')
+        if other.dirty:
+            other.refresh()
+
+    def matches (self, loc, other):
+        '''
+        Lists the nums in another IncrementalCorpus with exactly the same signature as loc here (dict_compar for one num).
+        Empty if loc isn't in the graph.
+        '''
+        self.check_comparable (other)
+        signature = self.signature(loc)
+        if signature is None:
+            return []
+        return [key for position, key in other.buckets.get(signature, ())]
+
+    def closest (self, loc, other, k=3, max_distance=None):
+        '''
+        Finds the k nums in another IncrementalCorpus whose signatures are closest to loc's here (top_k_matches for one num).
+
+        outputs:
+            nearest <- a list of up to k [key, distance] items, best first; ties go to the earlier sentence. Empty if
+                       loc isn't in the graph
+        '''
+        self.check_comparable (other)
+        signature = self.signature(loc)
+        if signature is None:
+            return []
+        return nearest_keys(signature, other.candidates, other.buckets, k, max_distance)
 
-## write funct that compares 2 dictionaries to determine which keys have the same values, and pair those keys
-def dict_compar (d1, d2):
-    matches = []
-    for k1, v1 in d1.iteritems():
-        for k2, v2 in d2.iteritems():
-            if v1[0].count('Y') == v2[0].count('Y') and v1[0].count('N') == v2[0].count('N'):
-                if v1[1].count('Y') == v2[1].count('Y') and v1[1].count('N') == v2[1].count('N'):
-                    if v1[2].count('Y') == v2[2].count('Y') and v1[2].count('N') == v2[2].count('N'):
-                        matches.append ([k1, k2])
-    return matches
 
 agk_prob_en = ['the donkey of the master', 'the brothers of the merchant', 'the merchants of the donkeys', 'the sons of the masters', 'the slave of the sons', 'the masters of the slaves', 'the house of the brothers', 'the master of the house']
 agk_prob_agk = ['ho ton hyion dulos', 'hoi ton dulon cyrioi', 'hoi tu emporu adelphoi', 'hoi ton onon emporoi', 'ho tu cyriu onos', 'ho tu oicu cyrios', 'ho ton adelphon oicos', 'hoi ton cyrion hyioi']
 
-tgt_list = agk_prob_en
-tgt_list = parse_words (tgt_list)
-tgt_list = english_sentences(tgt_list)
-#tgt_list = parse_ngrams(parse_words (tgt_list))
-#print puzzle_sentences(tgt_list)
-
-src_list = agk_prob_agk
-src_list = parse_ngrams(parse_words (src_list))
-src_list = puzzle_sentences(src_list)
-
-src_dict = deg_separ_matcher(src_list)
-tgt_dict = deg_separ_matcher(tgt_list)
-print src_dict
-print tgt_dict
-print dict_compar(src_dict, tgt_dict)
+
+def example ():
+    '''
+    Runs the whole pipeline on the little Greek/English problem above and prints both decision-tree dictionaries and
+    the keys that dict_compar pairs up.
+    '''
+    tgt_list = agk_prob_en
+    tgt_list = parse_words (tgt_list)
+    tgt_list = english_sentences(tgt_list)
+    #tgt_list = parse_ngrams(parse_words (tgt_list))
+    #print puzzle_sentences(tgt_list)
+
+    src_list = agk_prob_agk
+    src_list = parse_ngrams(parse_words (src_list))
+    src_list = puzzle_sentences(src_list)
+
+    src_dict = deg_separ_matcher(src_list)
+    tgt_dict = deg_separ_matcher(tgt_list)
+    print (src_dict)
+    print (tgt_dict)
+    print (dict_compar(src_dict, tgt_dict))
+
+
+def synthetic_corpus (n_sentences, vocab_size=200, word_length=6, seed=0):
+    '''
+    Makes up a parallel corpus: English-looking sentences and their word-for-word "translations" into an unknown script,
+    where every unknown word is a made-up stem plus one of a handful of endings, so ngrams have something to find.
+
+    Example:
+    en, unknown = synthetic_corpus(2, vocab_size=5, seed=1)     # en[i] and unknown[i] are translations of each other
+
+    inputs:
+        n_sentences <- how many sentence pairs to make
+        vocab_size  <- how many different words each side gets
+        word_length <- the average word length; words run from half of it to half again
+        seed        <- the same seed always makes the same corpus
+    outputs:
+        (english, unknown) <- two lists of n_sentences sentences each
+    '''
+    rng = random.Random(seed)
+
+    # only use rng.random(), which gives the same numbers on Python 2 and 3 (choice and randint don't)
+    def pick (n):
+        return int(rng.random() * n)
+
+    def make_word (letters, length):
+        return ''.join([letters[pick(len(letters))] for i in range (0, length)])
+
+    def make_length ():
+        shortest = max(2, word_length // 2)
+        return shortest + pick(max(2, word_length + word_length // 2) - shortest + 1)
+
+    english_words = []
+    unknown_stems = []
+    for i in range (0, vocab_size):
+        english_words.append(make_word('abcdefghijklmnopqrstuvwxyz', make_length()))
+        unknown_stems.append(make_word('aeiouptkmnslrhy', make_length()))
+    endings = ['', 'os', 'on', 'oi', 'u']
+
+    english = []
+    unknown = []
+    for i in range (0, n_sentences):
+        # favour some words over others, like real text does
+        words = [int(vocab_size * rng.random() ** 1.5) for w in range (0, 3 + pick(6))]
+        english.append(' '.join([english_words[w] for w in words]))
+        unknown.append(' '.join([unknown_stems[w] + endings[pick(len(endings))] for w in words]))
+    return english, unknown
+
+
+def timed_stage (stages, name, trace_memory, func, *args):
+    '''
+    Runs func(*args), records either how long it took or (if trace_memory and tracemalloc is available) the peak memory
+    it allocated under stages[name], and passes its result back.
+
+    NOTE tracing slows everything down, so a run that records peak_bytes never records seconds too (see benchmark)
+    '''
+    stage = stages.setdefault(name, {'seconds': None, 'peak_bytes': None})
+    if trace_memory and tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            result = func(*args)
+            stage['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return result
+    start = timeit.default_timer()
+    result = func(*args)
+    stage['seconds'] = round(timeit.default_timer() - start, 6)
+    return result
+
+
+def run_pipeline (stages, english, unknown, gram_length, backend, trace_memory):
+    # every stage of the example, one timed_stage at a time; returns the sizes of what came out
+    tgt_words = timed_stage(stages, 'parse_words_english', trace_memory, parse_words, english)
+    src_words = timed_stage(stages, 'parse_words_unknown', trace_memory, parse_words, unknown)
+    src_ngrams = timed_stage(stages, 'parse_ngrams', trace_memory, parse_ngrams, src_words, gram_length)
+    tgt_list = timed_stage(stages, 'english_sentences', trace_memory, english_sentences, tgt_words)
+    src_list = timed_stage(stages, 'puzzle_sentences', trace_memory, puzzle_sentences, src_ngrams)
+    src_dict = timed_stage(stages, 'deg_separ_matcher_unknown', trace_memory, deg_separ_matcher, src_list, backend)
+    tgt_dict = timed_stage(stages, 'deg_separ_matcher_english', trace_memory, deg_separ_matcher, tgt_list, backend)
+    matches = timed_stage(stages, 'dict_compar', trace_memory, dict_compar, src_dict, tgt_dict)
+    return {'english_locations': len(tgt_list), 'unknown_locations': len(src_list),
+            'english_keys': len(tgt_dict), 'unknown_keys': len(src_dict), 'matches': len(matches)}
+
+
+def benchmark (n_sentences, vocab_size=200, word_length=6, seed=0, gram_length=3, backend='python', trace_memory=False):
+    '''
+    Times every stage of the pipeline on a synthetic_corpus and returns the numbers as one JSON-ready dictionary.
+    With trace_memory, the pipeline is run a second time under tracemalloc for the memory peaks, so the times stay clean.
+
+    outputs:
+        result <- {'n_sentences': ..., 'vocab_size': ..., 'word_length': ..., 'seed': ..., 'gram_length': ..., 'backend': ...,
+                   'stages': {stage: {'seconds': ..., 'peak_bytes': ...}}, 'sizes': {what: how many}}
+                  NOTE peak_bytes is None without trace_memory, or where tracemalloc isn't available (Python 2)
+    '''
+    english, unknown = synthetic_corpus(n_sentences, vocab_size, word_length, seed)
+    stages = {}
+    sizes = run_pipeline(stages, english, unknown, gram_length, backend, False)
+    if trace_memory and tracemalloc is not None:
+        run_pipeline(stages, english, unknown, gram_length, backend, True)
+    return {
+        'n_sentences': n_sentences, 'vocab_size': vocab_size, 'word_length': word_length, 'seed': seed,
+        'gram_length': gram_length, 'backend': backend, 'stages': stages, 'sizes': sizes,
+    }
+
+
+def main (argv=None):
+    '''
+    Command line entry point. With no arguments, runs the example. With --bench, runs benchmark over every combination
+    of the given sizes and writes one JSON object per line, for tracking regressions and scaling curves.
+    '''
+    # only the command line needs these, so importing the module for its functions doesn't pay for them
+    import argparse
+    parser = argparse.ArgumentParser(description='Pattern matching between a known and an unknown language.')
+    parser.add_argument('--bench', action='store_true', help='benchmark the pipeline on synthetic corpora instead of running the example')
+    parser.add_argument('--sentences', default='50,100,200', help='comma-separated sentence counts')
+    parser.add_argument('--vocab', default='200', help='comma-separated vocabulary sizes')
+    parser.add_argument('--word-length', default='6', help='comma-separated average word lengths')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--gram-length', type=int, default=3)
+    parser.add_argument('--backend', default='python', choices=('python', 'sparse'))
+    parser.add_argument('--memory', action='store_true', help='also run each benchmark under tracemalloc for the memory peaks')
+    parser.add_argument('--profile', action='store_true', help='print the top of a cProfile report for each run to stderr')
+    parser.add_argument('--output', help='append results to this file instead of printing them')
+    args = parser.parse_args(argv)
+
+    if not args.bench:
+        example()
+        return
+
+    def numbers (text):
+        return [int(n) for n in text.split(',') if n]
+
+    if args.profile:
+        import cProfile
+        import pstats
+
+    out = open(args.output, 'a') if args.output else sys.stdout
+    try:
+        for n_sentences in numbers(args.sentences):
+            for vocab_size in numbers(args.vocab):
+                for word_length in numbers(args.word_length):
+                    run_args = (n_sentences, vocab_size, word_length, args.seed, args.gram_length, args.backend, args.memory)
+                    if args.profile:
+                        profiler = cProfile.Profile()
+                        result = profiler.runcall(benchmark, *run_args)
+                        pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(25)
+                    else:
+                        result = benchmark(*run_args)
+                    out.write(json.dumps(result, sort_keys=True) + '\n')
+                    out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()